@@ -2,6 +2,8 @@
 Это приложение на FastAPI предназначено для сбора, хранения и отображения игровых данных от различных игроков.
 Оно использует WebSocket для обеспечения обновлений данных в реальном времени, позволяя пользователям видеть изменения немедленно
 без необходимости обновления страницы.
+При запуске с несколькими воркерами (uvicorn --workers N) сообщения передаются между процессами
+через транспорт рассылки, выбранный переменной окружения BROADCAST_BACKEND ("local", "sqlite" или "redis").
 
 Основные компоненты приложения:
 
@@ -10,15 +12,34 @@
 
 2. Маршруты:
    - Главная страница ("/"): Отображает список всех игроков. Устанавливается WebSocket соединение для получения обновлений о новых игроках.
+     Список берётся из справочника players через кэш в памяти; поддерживаются ETag и If-None-Match.
+   - Поиск по диалогам ("/api/search?q=..."): Полнотекстовый поиск FTS5 по всем игрокам с фильтрами
+     player, data_type, since, until, ранжированием, фрагментами текста и постраничным выводом.
+   - Список игроков в JSON ("/api/players"): Время первой и последней записи и количество записей по типам данных.
    - Страница данных игрока ("/player/{player_name}"): Отображает детали конкретного игрока, включая его диалоги и временные метки.
+     История выводится постранично (параметры limit и cursor) и отправляется клиенту по частям, по одному дню за раз.
+   - История игрока в JSON ("/api/player/{player_name}"): Те же данные постранично; курсор следующей страницы в поле next_cursor.
+   - Добавление записи ("POST /player_data"): Принимает одну запись в формате PlayerDataIn.
+   - Пакетная загрузка ("POST /player_data/batch"): Принимает поток NDJSON и записывает его пакетами.
+   - Статистика записи ("/ingest/stats"): Глубина очереди записи и задержка сброса пакетов в базу.
+   - Метрики ("/metrics"): Время HTTP запросов, записи в базу, рассылки и запросов к базе в формате Prometheus.
 
 3. WebSocket соединения: Поддерживает мгновенные обновления. Когда данные игрока отправляются через WebSocket, 
    они автоматически обновляют информацию у всех подключенных пользователей.
+   Записи не пишутся в базу по одной: они ставятся в очередь и сбрасываются пакетными вставками
+   в отдельном потоке по достижении размера пакета или по таймеру. При переполнении очереди
+   отправитель ждёт (обратное давление), а при остановке приложения очередь дописывается до конца.
 
 4. CSS стили и интерфейс: Включает подключенные стили для улучшения визуального восприятия и создания дружелюбного интерфейса.
 
 Как это работает:
 1. При запуске приложения создается база данных и таблицы для хранения данных о игроках.
+   Существующая база обновляется миграциями (индексы и т.п.), а соединения настраиваются на режим WAL.
+   Записи старше ARCHIVE_RETENTION_DAYS дней периодически переносятся в помесячные архивные базы
+   (каталог ARCHIVE_DIR); страница игрока продолжает показывать их при листании назад.
+   Чтобы освобождённое место возвращалось и в существующей базе, один раз выполните python app/main.py vacuum.
+   Обработчики не выполняют запросы в цикле событий: чтение и запись идут через ограниченный пул потоков
+   (DB_POOL_SIZE) с таймаутом DB_QUERY_TIMEOUT.
 2. Пользователь открывает главную страницу, где отображается список всех игроков и устанавливается WebSocket соединение.
 3. При выборе игрока пользователь перенаправляется на страницу с его данными, где видна его история действий.
 4. Новые данные, поступающие для любого игрока, мгновенно отображаются у всех подключенных пользователей благодаря WebSocket.
@@ -39,6 +60,15 @@
 
    Примечание: В этом примере мы отправляем имя игрока, текст диалога и тип данных. Эти данные будут добавлены в базу данных.
 
+   Для загрузки большого объёма данных отправьте POST запрос на URL /player_data/batch
+   с телом в формате NDJSON (по одной записи PlayerDataIn на строку, поле "timestamp" необязательно):
+
+   URL: POST http://localhost:8000/player_data/batch
+   Заголовки:
+   Content-Type: application/x-ndjson
+
+   Ответ содержит количество принятых и отклонённых записей по каждому пакету.
+
 2. Для получения данных о конкретном игроке выполните GET запрос на URL /player/{player_name}:
 
    URL: GET http://localhost:8000/player/Игрок1
@@ -47,28 +77,337 @@
 """
 
 # Импорт необходимых библиотек из FastAPI и других модулей
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Query
+from fastapi.responses import HTMLResponse, StreamingResponse, Response, PlainTextResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import create_engine, event, func, text, Column, Index, Integer, String, Text, DateTime, and_, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
-from datetime import datetime
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timedelta, timezone
+import hashlib
+import html
 import json
-from typing import List, Dict
-from contextlib import contextmanager
+from urllib.parse import quote, urlencode
+from typing import List, Dict, Optional, Set
+from collections import defaultdict, namedtuple
+import bisect
+from contextlib import contextmanager, asynccontextmanager
+import asyncio
+import functools
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 
+logger = logging.getLogger(__name__)
+
+# Параметры очереди отложенной записи (можно переопределить через переменные окружения)
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 500))  # Максимальный размер пакета вставки
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", 0.2))  # Максимальное ожидание перед сбросом, сек
+INGEST_MAX_QUEUE = int(os.environ.get("INGEST_MAX_QUEUE", 10000))  # Ёмкость очереди, после которой включается обратное давление
+INGEST_PUT_TIMEOUT = float(os.environ.get("INGEST_PUT_TIMEOUT", 5.0))  # Сколько ждать места в переполненной очереди, сек
+INGEST_HTTP_CHUNK = int(os.environ.get("INGEST_HTTP_CHUNK", 5000))  # Размер пакета вставки при загрузке NDJSON
+INGEST_RETRIES = int(os.environ.get("INGEST_RETRIES", 5))  # Повторы пакета при временной ошибке базы (например, database is locked)
+INGEST_RETRY_BACKOFF = 0.1  # Пауза перед первым повтором, далее удваивается, сек
+INGEST_MAX_ERRORS = 20  # Сколько ошибок разбора строк возвращать в ответе пакетной загрузки
+
+# Параметры рассылки по WebSocket
+BROADCAST_QUEUE_SIZE = int(os.environ.get("BROADCAST_QUEUE_SIZE", 256))  # Ёмкость очереди исходящих сообщений подписчика
+# Поведение при переполнении очереди медленного подписчика:
+# "drop_oldest" - отбросить самое старое сообщение, "coalesce" - оставить только самое новое,
+# "disconnect" - отключить подписчика
+SLOW_CONSUMER_POLICY = os.environ.get("SLOW_CONSUMER_POLICY", "drop_oldest")
+
+# Транспорт рассылки между процессами (для запуска uvicorn с несколькими воркерами):
+# "local" - только в пределах процесса, "sqlite" - общий файл-концентратор без внешних сервисов,
+# "redis" - Redis-совместимый сервер (требуется пакет redis)
+BROADCAST_BACKEND = os.environ.get("BROADCAST_BACKEND", "local")
+BROADCAST_HUB_PATH = os.environ.get("BROADCAST_HUB_PATH", "./broadcast_hub.db")  # Файл-концентратор для "sqlite"
+BROADCAST_POLL_INTERVAL = float(os.environ.get("BROADCAST_POLL_INTERVAL", 0.05))  # Период опроса концентратора, сек
+BROADCAST_HUB_RETENTION = float(os.environ.get("BROADCAST_HUB_RETENTION", 60.0))  # Сколько хранить сообщения в концентраторе, сек
+BROADCAST_REDIS_URL = os.environ.get("BROADCAST_REDIS_URL", "redis://localhost:6379/0")
+BROADCAST_CHANNEL = os.environ.get("BROADCAST_CHANNEL", "player_data")  # Канал Redis для рассылки
+BROADCAST_RECONNECT_DELAY = float(os.environ.get("BROADCAST_RECONNECT_DELAY", 1.0))  # Пауза перед повторной подпиской, сек
+
+# Параметры постраничного вывода истории игрока
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 500))  # Записей на странице по умолчанию
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", 5000))  # Максимальный размер страницы
+HISTORY_FETCH_SIZE = 200  # Сколько записей читать из базы за один запрос при потоковой отрисовке
+
+# Параметры полнотекстового поиска
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", 50))  # Результатов на странице по умолчанию
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get("SEARCH_MAX_PAGE_SIZE", 500))  # Максимальный размер страницы
+SEARCH_SNIPPET_TOKENS = 12  # Длина фрагмента текста с совпадением, в словах
+
+# Словарь для отображения названий месяцев на русском
+MONTH_NAMES = {
+    1: "января", 2: "февраля", 3: "марта", 4: "апреля", 5: "мая", 6: "июня",
+    7: "июля", 8: "августа", 9: "сентября", 10: "октября", 11: "ноября", 12: "декабря"
+}
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')  # Часовой пояс для отображения времени
+
+# Настройки SQLite, применяемые к каждому новому соединению
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")  # В режиме WAL NORMAL не теряет целостность базы
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # Размер отображения файла в память, байт
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024))  # Размер кэша страниц на соединение, КБ
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))  # Ожидание блокировки другим процессом, мс
+
+# Параметры доступа к базе данных из асинхронных обработчиков
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))  # Потоков для запросов и соединений в пуле
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 4))  # Дополнительные соединения (поток записи, миграции)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10.0))  # Ожидание свободного соединения, сек
+DB_QUERY_TIMEOUT = float(os.environ.get("DB_QUERY_TIMEOUT", 30.0))  # Ожидание результата запроса, сек
+
+# Параметры архивации: записи старше ARCHIVE_RETENTION_DAYS переносятся из основной базы
+# в помесячные архивные базы SQLite в каталоге ARCHIVE_DIR (0, значение по умолчанию, отключает архивацию)
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "./archive")
+ARCHIVE_RETENTION_DAYS = int(os.environ.get("ARCHIVE_RETENTION_DAYS", 0))
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", 3600.0))  # Период запуска архивации, сек
+ARCHIVE_CHUNK = int(os.environ.get("ARCHIVE_CHUNK", 5000))  # Записей, переносимых одной короткой транзакцией
+ARCHIVE_PAUSE = 0.05  # Пауза между транзакциями, чтобы не задерживать запись новых данных, сек
+ARCHIVE_VACUUM_PAGES = int(os.environ.get("ARCHIVE_VACUUM_PAGES", 2000))  # Страниц, освобождаемых за один шаг
+
+# Время жизни кэша списка игроков, сек. Внутри процесса кэш сбрасывается при каждой записи,
+# а срок жизни ограничивает задержку обновления при записи другими воркерами.
+PLAYER_CACHE_TTL = float(os.environ.get("PLAYER_CACHE_TTL", 5.0))
+
+# Метрики в формате Prometheus. Гистограммы хранят счётчики по корзинам, поэтому память
+# не растёт с числом наблюдений; квантили оцениваются интерполяцией внутри корзины.
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(labelnames: tuple, values: tuple) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels) -> float:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = METRICS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # Метки -> [счётчики по корзинам (+Inf последней), сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        # Оценка квантиля, как histogram_quantile в Prometheus
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None or not series[2]:
+                return None
+            counts, total = list(series[0]), series[2]
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total_sum, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                labels = format_labels((*self.labelnames, "le"), (*key, bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total_sum}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+# Показатель, значение которого вычисляется в момент чтения /metrics
+class Gauge:
+    def __init__(self, name: str, documentation: str, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.callback()}"]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()  # Создание реестра метрик
+HTTP_REQUEST_SECONDS = metrics.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP запроса до отправки последнего байта ответа",
+    ("method", "route", "status")))
+INGEST_FLUSH_SECONDS = metrics.register(Histogram(
+    "ingest_flush_duration_seconds", "Время пакетной вставки записей из очереди записи"))
+INGEST_ROWS = metrics.register(Counter(
+    "ingest_rows_total", "Записи, полученные для сохранения", ("source", "result")))
+BROADCAST_SECONDS = metrics.register(Histogram(
+    "broadcast_fanout_duration_seconds", "Время постановки сообщения в очереди локальных подписчиков"))
+BROADCAST_DELIVERIES = metrics.register(Counter(
+    "broadcast_deliveries_total", "Сообщения, поставленные в очереди подписчиков"))
+DB_WAIT_SECONDS = metrics.register(Histogram(
+    "db_queue_wait_seconds", "Ожидание свободного потока в пуле запросов к базе"))
+DB_QUERY_SECONDS = metrics.register(Histogram(
+    "db_query_duration_seconds", "Время выполнения функции доступа к базе", ("function",)))
+
+# ASGI-прослойка для измерения HTTP запросов. Время считается до отправки последней части тела,
+# поэтому для потоковых страниц учитывается вся отрисовка, а не только заголовки.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        finished = False
+
+        def observe(status):
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                         method=scope["method"], route=route, status=status)
+
+        async def send_wrapper(message):
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = True
+                observe(status)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            # Необработанное исключение: ответ 500 отправит внешняя прослойка Starlette, а если
+            # ошибка возникла во время потоковой передачи, ответ оборван — в обоих случаях учитываем как 500
+            if not finished:
+                observe(500)
+            raise
+
+# Жизненный цикл приложения: запуск фонового потока записи и его корректная остановка
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    # Оповещение главной страницы о новых игроках, обнаруженных потоком записи
+    ingest_queue.on_new_players = lambda names: asyncio.run_coroutine_threadsafe(announce_players(), loop)
+    db.start()  # Пул потоков для запросов к базе
+    ingest_queue.start()
+    await manager.backend.start(manager.publish)  # Подключение к транспорту рассылки между воркерами
+    archiver = asyncio.create_task(run_archiver()) if ARCHIVE_RETENTION_DAYS > 0 else None
+    try:
+        yield
+    finally:
+        if archiver is not None:
+            archiver.cancel()
+            await asyncio.gather(archiver, return_exceptions=True)
+        await manager.backend.stop()
+        await asyncio.to_thread(ingest_queue.stop)  # Сброс оставшихся записей перед завершением
+        db.shutdown()
+
 # Создание экземпляра приложения FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Подключение статических файлов (например, CSS) из директории "static"
 from fastapi.staticfiles import StaticFiles
 app.mount("/static", StaticFiles(directory="static"), name="static")
+app.add_middleware(MetricsMiddleware)  # Измерение времени HTTP запросов для /metrics
 
 # Определение URL для базы данных SQLite
-DATABASE_URL = "sqlite:///./game_data.db"
-engine = create_engine(DATABASE_URL)  # Создание движка базы данных
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./game_data.db")
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=QueuePool,  # Соединения переиспользуются потоками пула запросов
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    connect_args={"check_same_thread": False},
+)  # Создание движка базы данных
+
+# Настройка каждого нового соединения: WAL позволяет читать во время записи,
+# остальные параметры уменьшают число синхронизаций с диском и обращений к файлу
+def configure_sqlite_connection(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    try:
+        # Для новой базы режим auto_vacuum применяется при создании первой таблицы;
+        # для существующей эта настройка ничего не меняет без VACUUM (см. enable_incremental_vacuum)
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")  # Отрицательное значение задаётся в КБ
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+event.listen(engine, "connect", configure_sqlite_connection)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)  # Фабрика сессий для базы данных
 session_factory = scoped_session(SessionLocal)  # Обеспечение потокобезопасной сессии
 Base = declarative_base()  # Создание базового класса для моделей
@@ -76,20 +415,188 @@ Base = declarative_base()  # Создание базового класса дл
 # Определение модели данных для игрока
 class PlayerData(Base):
     __tablename__ = "player_data"  # Имя таблицы в базе данных
-    id = Column(Integer, primary_key=True, index=True)  # Первичный ключ
-    player_name = Column(String(50), index=True)  # Имя игрока
+    id = Column(Integer, primary_key=True)  # Первичный ключ
+    player_name = Column(String(50))  # Имя игрока
     dialog_text = Column(Text)  # Текст диалога
     data_type = Column(String(50))  # Тип данных (например, "диалог", "ввод" и т.д.)
     timestamp = Column(DateTime, default=datetime.utcnow)  # Время создания записи
 
+    # Составные индексы для истории игрока: фильтр по имени (и типу) и сортировка по времени
+    # читаются прямо из индекса, без временного B-дерева для ORDER BY
+    __table_args__ = (
+        Index("ix_player_data_player_ts", "player_name", "timestamp"),
+        Index("ix_player_data_player_type_ts", "player_name", "data_type", "timestamp"),
+    )
+
+# Справочник игроков: сводка по журналу player_data, обновляемая при каждой записи
+class Player(Base):
+    __tablename__ = "players"
+    name = Column(String(50), primary_key=True)  # Имя игрока
+    first_seen = Column(DateTime)  # Время первой записи
+    last_seen = Column(DateTime)  # Время последней записи
+    total = Column(Integer, nullable=False, default=0)  # Общее количество записей
+
+# Количество записей игрока по каждому типу данных
+class PlayerTypeCount(Base):
+    __tablename__ = "player_type_counts"
+    player_name = Column(String(50), primary_key=True)
+    data_type = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# Манифест архива: какие месяцы перенесены в архивные базы и какой диапазон времени они покрывают
+class ArchiveSegment(Base):
+    __tablename__ = "archive_manifest"
+    month = Column(String(7), primary_key=True)  # Месяц в формате ГГГГ-ММ (UTC)
+    path = Column(String(255), nullable=False)  # Имя файла архивной базы в ARCHIVE_DIR
+    row_count = Column(Integer, nullable=False, default=0)
+    min_timestamp = Column(DateTime)
+    max_timestamp = Column(DateTime)
+
+# Игроки, записи которых есть в архиве за месяц: страница игрока открывает только архивные базы с его записями
+class ArchivePlayer(Base):
+    __tablename__ = "archive_players"
+    player_name = Column(String(50), primary_key=True)
+    month = Column(String(7), primary_key=True)
+
 # Создание всех таблиц в базе данных
 Base.metadata.create_all(bind=engine)
 
+# Заполнение archive_players по уже созданным архивным базам
+def backfill_archive_players(cursor):
+    for month, path in cursor.execute("SELECT month, path FROM archive_manifest").fetchall():
+        location = os.path.join(ARCHIVE_DIR, path)
+        if not os.path.exists(location):
+            continue
+        archive = sqlite3.connect(f"file:{location}?mode=ro", uri=True)
+        try:
+            names = [name for (name,) in archive.execute(
+                "SELECT DISTINCT player_name FROM player_data WHERE player_name IS NOT NULL")]
+        finally:
+            archive.close()
+        cursor.executemany("INSERT OR IGNORE INTO archive_players (player_name, month) VALUES (?, ?)",
+                           [(name, month) for name in names])
+
+# Миграции схемы: шаги применяются по порядку, номер применённой версии хранится в PRAGMA user_version.
+# Это позволяет обновлять существующие файлы game_data.db на месте при запуске приложения.
+MIGRATIONS = [
+    # 1: составные индексы вместо одиночных; индекс по id дублирует первичный ключ,
+    # а индекс по player_name является префиксом новых индексов
+    [
+        "CREATE INDEX IF NOT EXISTS ix_player_data_player_ts ON player_data (player_name, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_player_data_player_type_ts ON player_data (player_name, data_type, timestamp)",
+        "DROP INDEX IF EXISTS ix_player_data_id",
+        "DROP INDEX IF EXISTS ix_player_data_player_name",
+        "ANALYZE",
+    ],
+    # 2: заполнение справочника игроков по уже накопленному журналу
+    [
+        "DELETE FROM players",
+        "DELETE FROM player_type_counts",
+        "INSERT INTO players (name, first_seen, last_seen, total) "
+        "SELECT player_name, MIN(timestamp), MAX(timestamp), COUNT(*) FROM player_data "
+        "WHERE player_name IS NOT NULL GROUP BY player_name",
+        "INSERT INTO player_type_counts (player_name, data_type, count) "
+        "SELECT player_name, data_type, COUNT(*) FROM player_data "
+        "WHERE player_name IS NOT NULL AND data_type IS NOT NULL GROUP BY player_name, data_type",
+    ],
+    # 3: полнотекстовый индекс FTS5 по dialog_text. Таблица хранит только индекс (content='player_data'),
+    # триггеры поддерживают его при вставке, удалении и изменении записей, 'rebuild' индексирует существующие записи
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS player_data_fts USING fts5("
+        "dialog_text, content='player_data', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS player_data_fts_insert AFTER INSERT ON player_data BEGIN "
+        "INSERT INTO player_data_fts (rowid, dialog_text) VALUES (new.id, new.dialog_text); END",
+        "CREATE TRIGGER IF NOT EXISTS player_data_fts_delete AFTER DELETE ON player_data BEGIN "
+        "INSERT INTO player_data_fts (player_data_fts, rowid, dialog_text) VALUES ('delete', old.id, old.dialog_text); END",
+        "CREATE TRIGGER IF NOT EXISTS player_data_fts_update AFTER UPDATE OF dialog_text ON player_data BEGIN "
+        "INSERT INTO player_data_fts (player_data_fts, rowid, dialog_text) VALUES ('delete', old.id, old.dialog_text); "
+        "INSERT INTO player_data_fts (rowid, dialog_text) VALUES (new.id, new.dialog_text); END",
+        "INSERT INTO player_data_fts (player_data_fts) VALUES ('rebuild')",
+    ],
+    # 4: индекс по времени для выбора записей, подлежащих архивации
+    [
+        "CREATE INDEX IF NOT EXISTS ix_player_data_ts ON player_data (timestamp)",
+    ],
+    # 5: список игроков каждого архивного месяца
+    [
+        backfill_archive_players,
+    ],
+]
+
+# Применение недостающих миграций. BEGIN IMMEDIATE не даёт нескольким воркерам выполнять миграции одновременно.
+def run_migrations(bind=engine):
+    connection = bind.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            for number, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(f"PRAGMA user_version={number}")
+                logger.info("Применена миграция схемы %d", number)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+        cursor = connection.cursor()
+        auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        cursor.close()
+        if ARCHIVE_RETENTION_DAYS > 0 and auto_vacuum != 2:
+            logger.warning("Место после архивации не будет освобождаться: выполните однократно "
+                           "python app/main.py vacuum при остановленном приложении")
+    finally:
+        connection.close()
+
+# Перевод существующей базы в режим auto_vacuum=INCREMENTAL, чтобы место после архивации освобождалось
+# небольшими шагами. Требуется однократный полный VACUUM, который блокирует базу и переписывает весь файл,
+# поэтому он выполняется отдельной командой обслуживания, а не при запуске каждого воркера.
+def enable_incremental_vacuum(bind=engine):
+    connection = bind.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("VACUUM")
+        logger.info("База переведена в режим auto_vacuum=INCREMENTAL")
+    finally:
+        connection.close()
+
+run_migrations()
+
 # Определение модели для входящих данных
 class PlayerDataIn(BaseModel):
     player_name: str  # Имя игрока
     dialog_text: str  # Текст диалога
     data_type: str  # Тип данных
+    timestamp: Optional[datetime] = None  # Время события (например, при повторной отправке накопленных данных)
+
+# В базе время хранится в UTC без часового пояса
+def to_utc_naive(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+# Преобразование входящих данных в запись для пакетной вставки
+def record_from_input(item: PlayerDataIn) -> dict:
+    timestamp = item.timestamp
+    if timestamp is None:
+        timestamp = datetime.utcnow()  # Время фиксируется при получении, а не при записи пакета
+    else:
+        timestamp = to_utc_naive(timestamp)
+    return {
+        "player_name": item.player_name,
+        "dialog_text": item.dialog_text,
+        "data_type": item.data_type,
+        "timestamp": timestamp,
+    }
 
 # Контекстный менеджер для работы с базой данных
 @contextmanager
@@ -100,34 +607,651 @@ def get_db():
     finally:
         db.close()  # Закрытие сессии после использования
 
+# Асинхронный доступ к базе: синхронные функции работы с сессией выполняются в ограниченном пуле потоков,
+# поэтому медленный запрос не останавливает цикл событий и остальные WebSocket и HTTP запросы.
+# По таймауту обработчик получает TimeoutError, а запрос в потоке дорабатывает до конца.
+class DatabaseExecutor:
+    def __init__(self, max_workers: int = DB_POOL_SIZE, timeout: float = DB_QUERY_TIMEOUT):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor: Optional[ThreadPoolExecutor] = None  # Создаётся при запуске приложения
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+
+    def shutdown(self):
+        # Дожидается выполняющихся запросов; после остановки пул можно запустить снова через start()
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    async def run(self, fn, *args, timeout: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool(), functools.partial(self._timed, fn, time.perf_counter(), *args))
+        return await asyncio.wait_for(future, timeout if timeout is not None else self.timeout)
+
+    # Выполнение без таймаута: для записи, результат которой нужно сообщить клиенту точно.
+    # По таймауту запрос продолжил бы выполняться в потоке и мог бы зафиксировать данные уже после ответа.
+    async def run_to_completion(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(), functools.partial(self._timed, fn, time.perf_counter(), *args))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            raise RuntimeError("Пул запросов к базе не запущен")
+        return self._executor
+
+    @staticmethod
+    def _timed(fn, submitted: float, *args):
+        started = time.perf_counter()
+        DB_WAIT_SECONDS.observe(started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, function=getattr(fn, "__qualname__", repr(fn)))
+
+db = DatabaseExecutor()  # Создание экземпляра пула запросов к базе
+
+# Пакетная вставка записей одной транзакцией
+def bulk_insert_player_data(records: List[dict]) -> List[str]:
+    # В той же транзакции обновляется справочник игроков; возвращаются имена новых игроков
+    with get_db() as session:
+        try:
+            session.bulk_insert_mappings(PlayerData, records)
+            new_players = update_player_directory(session, records)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+    player_cache.invalidate(players_added=bool(new_players))
+    return new_players
+
+# Инкрементальное обновление справочника игроков по пакету записей
+def update_player_directory(session, records: List[dict]) -> List[str]:
+    players: Dict[str, dict] = {}
+    type_counts: Dict[tuple, int] = defaultdict(int)
+    for record in records:
+        name, timestamp = record["player_name"], record["timestamp"]
+        summary = players.get(name)
+        if summary is None:
+            players[name] = {"name": name, "first_seen": timestamp, "last_seen": timestamp, "total": 1}
+        else:
+            summary["first_seen"] = min(summary["first_seen"], timestamp)
+            summary["last_seen"] = max(summary["last_seen"], timestamp)
+            summary["total"] += 1
+        type_counts[(name, record["data_type"])] += 1
+
+    existing = {row[0] for row in session.query(Player.name).filter(Player.name.in_(list(players)))}
+    stmt = sqlite_insert(Player)
+    session.execute(stmt.on_conflict_do_update(index_elements=[Player.name], set_={
+        "first_seen": func.min(Player.first_seen, stmt.excluded.first_seen),
+        "last_seen": func.max(Player.last_seen, stmt.excluded.last_seen),
+        "total": Player.total + stmt.excluded.total,
+    }), list(players.values()))
+    stmt = sqlite_insert(PlayerTypeCount)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[PlayerTypeCount.player_name, PlayerTypeCount.data_type],
+        set_={"count": PlayerTypeCount.count + stmt.excluded.count},
+    ), [{"player_name": name, "data_type": data_type, "count": count}
+        for (name, data_type), count in type_counts.items()])
+    return sorted(name for name in players if name not in existing)
+
+# Кэш списка игроков для главной страницы и /api/players. Хранятся две записи со своими ETag:
+# "index" (имена игроков и готовый HTML главной страницы) меняется только при появлении новых игроков,
+# "directory" (JSON со временем и количеством записей) — после любой записи данных.
+# Записи пересчитываются после инвалидации или по истечении PLAYER_CACHE_TTL.
+class PlayerDirectoryCache:
+    KINDS = ("index", "directory")
+
+    def __init__(self, ttl: float = PLAYER_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Optional[dict]] = dict.fromkeys(self.KINDS)
+        self._expires = dict.fromkeys(self.KINDS, 0.0)
+        self._generations = dict.fromkeys(self.KINDS, 0)  # Увеличиваются при каждой инвалидации записи
+
+    def invalidate(self, players_added: bool = True):
+        with self._lock:
+            for kind in self.KINDS if players_added else ("directory",):
+                self._entries[kind] = None
+                self._generations[kind] += 1
+
+    def peek(self, kind: str = "directory") -> Optional[dict]:
+        # Актуальная запись кэша без обращения к базе (или None, если кэш нужно заполнить)
+        with self._lock:
+            entry = self._entries[kind]
+            if entry is not None and time.monotonic() < self._expires[kind]:
+                return entry
+            return None
+
+    def get(self, kind: str = "directory") -> dict:
+        with self._lock:
+            entry = self._entries[kind]
+            if entry is not None and time.monotonic() < self._expires[kind]:
+                return entry
+            generation = self._generations[kind]
+        entry = self._load_index() if kind == "index" else self._load()
+        with self._lock:
+            # Если во время загрузки кэш инвалидировали, результат мог устареть — не сохраняем его
+            if self._generations[kind] == generation:
+                self._entries[kind] = entry
+                self._expires[kind] = time.monotonic() + self.ttl
+        return entry
+
+    @staticmethod
+    def _load_index() -> dict:
+        with get_db() as session:
+            names = [name for (name,) in session.query(Player.name).order_by(Player.name)]
+        return {
+            "names": names,
+            "html": render_index_page(names),
+            "etag": make_etag(json.dumps(names, ensure_ascii=False)),
+        }
+
+    @staticmethod
+    def _load() -> dict:
+        with get_db() as session:
+            counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+            for name, data_type, count in session.query(
+                    PlayerTypeCount.player_name, PlayerTypeCount.data_type, PlayerTypeCount.count):
+                counts[name][data_type] = count
+            players = [{
+                "name": player.name,
+                "first_seen": player.first_seen.isoformat() if player.first_seen else None,
+                "last_seen": player.last_seen.isoformat() if player.last_seen else None,
+                "total": player.total,
+                "counts": counts.get(player.name, {}),
+            } for player in session.query(Player).order_by(Player.name)]
+        body = json.dumps({"players": players}, ensure_ascii=False)
+        return {
+            "players": players,
+            "json": body,
+            "etag": make_etag(body),
+        }
+
+def make_etag(body: str) -> str:
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+player_cache = PlayerDirectoryCache()  # Создание экземпляра кэша списка игроков
+
+# Проверка заголовка If-None-Match: клиент уже имеет актуальную версию ответа
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+# Получение записи кэша игроков; заполнение кэша выполняется в пуле запросов
+async def get_player_directory(kind: str = "directory") -> dict:
+    return player_cache.peek(kind) or await db.run(player_cache.get, kind)
+
+# Рассылка обновлённого списка игроков главной странице (она подписана на тип "all")
+async def announce_players():
+    names = (await get_player_directory("index"))["names"]
+    await manager.broadcast(json.dumps({"players": names}, ensure_ascii=False), 'all')
+
+# Очередь отложенной записи: входящие записи копятся в памяти и сбрасываются в базу
+# пакетными вставками в отдельном потоке, не блокируя цикл событий
+class IngestQueue:
+    _WAKEUP = object()  # Служебный элемент очереди для пробуждения потока при остановке
+
+    def __init__(self, batch_size: int = INGEST_BATCH_SIZE, flush_interval: float = INGEST_FLUSH_INTERVAL,
+                 max_size: int = INGEST_MAX_QUEUE, put_timeout: float = INGEST_PUT_TIMEOUT):
+        self.batch_size = batch_size
+        self.on_new_players = None  # Вызывается из потока записи со списком новых игроков
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._stop = threading.Event()
+        self._thread = None
+        # Статистика для настройки параметров очереди
+        self.flushed_rows = 0
+        self.flushed_batches = 0
+        self.failed_rows = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Остановка потока: он дописывает всё, что осталось в очереди, и завершается
+        self._stop.set()
+        if self._thread is not None:
+            self._queue.put(self._WAKEUP)  # Прерывает ожидание flush_interval в потоке записи
+            self._thread.join()
+            self._thread = None
+
+    async def put(self, record: dict):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Обратное давление: ждём места в очереди вне цикла событий, при таймауте выбрасывается queue.Full
+            await asyncio.to_thread(self._queue.put, record, True, self.put_timeout)
+
+    def _collect(self) -> List[dict]:
+        # Сбор пакета: до batch_size записей или до истечения flush_interval с момента первой записи
+        try:
+            if self._stop.is_set():
+                item = self._queue.get_nowait()  # При остановке дописываем остаток очереди без ожидания
+            else:
+                item = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        if item is self._WAKEUP:
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._WAKEUP:
+                break
+            batch.append(item)
+        return batch
+
+    def _flush(self, batch: List[dict]):
+        started = time.perf_counter()
+        try:
+            new_players = self._insert(batch)
+        except Exception:
+            self.failed_rows += len(batch)
+            INGEST_ROWS.inc(len(batch), source="queue", result="failed")
+            logger.exception("Не удалось записать пакет из %d записей", len(batch))
+            return
+        latency = time.perf_counter() - started
+        INGEST_FLUSH_SECONDS.observe(latency)
+        INGEST_ROWS.inc(len(batch), source="queue", result="stored")
+        if new_players and self.on_new_players is not None:
+            self.on_new_players(new_players)
+        self.flushed_rows += len(batch)
+        self.flushed_batches += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self._total_flush_latency += latency
+
+    @staticmethod
+    def _insert(batch: List[dict]) -> List[str]:
+        # Одна пакетная вставка и один коммит на пакет. Записи уже разосланы зрителям, поэтому
+        # при временной ошибке базы (блокировка во время пакетной загрузки или архивации) пакет повторяется
+        backoff = INGEST_RETRY_BACKOFF
+        for attempt in range(INGEST_RETRIES):
+            try:
+                return bulk_insert_player_data(batch)
+            except OperationalError:
+                logger.warning("Временная ошибка записи пакета из %d записей, повтор через %.1f с",
+                               len(batch), backoff, exc_info=True)
+                time.sleep(backoff)
+                backoff *= 2
+        return bulk_insert_player_data(batch)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            elif self._stop.is_set() and self._queue.empty():
+                break
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "flushed_rows": self.flushed_rows,
+            "flushed_batches": self.flushed_batches,
+            "failed_rows": self.failed_rows,
+            "last_flush_latency_ms": round(self.last_flush_latency * 1000, 3),
+            "avg_flush_latency_ms": round(self._total_flush_latency / self.flushed_batches * 1000, 3) if self.flushed_batches else 0.0,
+            "max_flush_latency_ms": round(self.max_flush_latency * 1000, 3),
+        }
+
+ingest_queue = IngestQueue()  # Создание экземпляра очереди записи
+
+# Транспорт рассылки в пределах одного процесса: сообщение сразу доставляется локальным подписчикам.
+# Остальные транспорты дополнительно передают сообщение другим воркерам, которые доставляют его своим подписчикам.
+class LocalBroadcastBackend:
+    def __init__(self):
+        self.deliver = None  # Функция локальной доставки (message, data_type)
+
+    async def start(self, deliver):
+        self.deliver = deliver
+
+    async def publish(self, message: str, data_type: str):
+        self.deliver(message, data_type)
+
+    async def stop(self):
+        pass
+
+# Транспорт через общий файл SQLite: каждый воркер дописывает сообщения в журнал
+# и периодически читает чужие сообщения после последнего прочитанного id.
+# Не требует внешних сервисов и работает для всех воркеров на одной машине.
+class SqliteBroadcastBackend(LocalBroadcastBackend):
+    def __init__(self, path: str = BROADCAST_HUB_PATH, poll_interval: float = BROADCAST_POLL_INTERVAL,
+                 retention: float = BROADCAST_HUB_RETENTION):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = uuid.uuid4().hex  # Идентификатор воркера, чтобы не доставлять свои сообщения повторно
+        self._conn = None
+        self._lock = threading.Lock()
+        self._outbox: List[tuple] = []  # Сообщения, ожидающие записи в концентратор
+        self._wakeup = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_id = 0
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._open)
+        self._tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._poller())]
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")  # Журнал рассылки не нужно сохранять при сбое питания
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS broadcast_log ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT, data_type TEXT, message TEXT, created REAL)"
+        )
+        self._last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM broadcast_log").fetchone()[0]
+
+    async def publish(self, message: str, data_type: str):
+        self.deliver(message, data_type)  # Локальные подписчики получают сообщение без задержки
+        self._outbox.append((self.origin, data_type, message, time.time()))
+        self._wakeup.set()
+
+    def _write(self, rows: List[tuple]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO broadcast_log (origin, data_type, message, created) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def _read(self) -> List[tuple]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, origin, data_type, message FROM broadcast_log WHERE id > ? ORDER BY id LIMIT 1000",
+                (self._last_id,),
+            ).fetchall()
+            if rows and rows[-1][0] // 1000 != self._last_id // 1000:
+                # Примерно раз в тысячу сообщений удаляем устаревшие записи журнала
+                self._conn.execute("DELETE FROM broadcast_log WHERE created < ?", (time.time() - self.retention,))
+            if rows:
+                self._last_id = rows[-1][0]
+            return rows
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            rows, self._outbox = self._outbox, []  # Все накопившиеся сообщения пишутся одной транзакцией
+            if not rows:
+                continue
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception:
+                logger.exception("Не удалось записать %d сообщений в концентратор рассылки", len(rows))
+
+    async def _poller(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await asyncio.to_thread(self._read)
+            except Exception:
+                logger.exception("Не удалось прочитать концентратор рассылки")
+                continue
+            for _, origin, data_type, message in rows:
+                if origin != self.origin:
+                    self.deliver(message, data_type)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._outbox:
+            rows, self._outbox = self._outbox, []
+            await asyncio.to_thread(self._write, rows)  # Недописанные сообщения уходят другим воркерам
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+# Транспорт через Redis-совместимый сервер (канал pub/sub). Клиент можно передать явно,
+# например локальную подмену сервера для тестов; иначе он создаётся по BROADCAST_REDIS_URL.
+class RedisBroadcastBackend(LocalBroadcastBackend):
+    def __init__(self, url: str = BROADCAST_REDIS_URL, channel: str = BROADCAST_CHANNEL, client=None):
+        super().__init__()
+        if client is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("Для BROADCAST_BACKEND=redis требуется пакет redis")
+            client = aioredis.from_url(url)
+        self.client = client
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()  # Незавершённые публикации
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        await self._subscribe()
+        self._task = asyncio.create_task(self._listen())
+
+    async def _subscribe(self):
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+
+    async def publish(self, message: str, data_type: str):
+        self.deliver(message, data_type)
+        payload = json.dumps({"origin": self.origin, "data_type": data_type, "message": message})
+        task = asyncio.create_task(self.client.publish(self.channel, payload))  # Публикация не задерживает отправителя
+        self._pending.add(task)
+        task.add_done_callback(self._published)
+
+    def _published(self, task: asyncio.Task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Не удалось опубликовать сообщение в Redis", exc_info=task.exception())
+
+    # Приём сообщений других воркеров. При потере соединения подписка восстанавливается
+    # через BROADCAST_RECONNECT_DELAY; сообщения, опубликованные за это время, не доставляются.
+    async def _listen(self):
+        while True:
+            try:
+                if self._pubsub is None:
+                    await self._subscribe()
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    try:
+                        payload = json.loads(item["data"])
+                    except (ValueError, TypeError):
+                        continue
+                    if payload.get("origin") != self.origin:
+                        self.deliver(payload["message"], payload["data_type"])
+                logger.warning("Подписка на канал Redis завершилась, повторная подписка")
+            except Exception:
+                logger.warning("Потеряно соединение с Redis, повторная подписка через %.1f с",
+                               BROADCAST_RECONNECT_DELAY, exc_info=True)
+            await self._close_pubsub()
+            await asyncio.sleep(BROADCAST_RECONNECT_DELAY)
+
+    async def _close_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is None:
+            return
+        try:
+            await pubsub.close()
+        except Exception:
+            logger.debug("Ошибка при закрытии подписки Redis", exc_info=True)
+
+    async def stop(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.channel)
+            except Exception:
+                logger.debug("Ошибка при отписке от канала Redis", exc_info=True)
+            await self._close_pubsub()
+
+# Создание транспорта рассылки по имени из настроек
+def create_broadcast_backend(name: str = BROADCAST_BACKEND) -> LocalBroadcastBackend:
+    if name == "local":
+        return LocalBroadcastBackend()
+    if name == "sqlite":
+        return SqliteBroadcastBackend()
+    if name == "redis":
+        return RedisBroadcastBackend()
+    raise ValueError(f"Неизвестный транспорт рассылки: {name}")
+
+# Подписчик WebSocket: собственная ограниченная очередь исходящих сообщений и задача отправки,
+# поэтому медленный получатель не задерживает остальных и отправителя
+class Subscriber:
+    POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+    def __init__(self, websocket: WebSocket, data_type: str, max_queue: int, policy: str):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Неизвестная политика для медленных подписчиков: {policy}")
+        self.websocket = websocket
+        self.data_type = data_type
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0  # Количество отброшенных сообщений
+
+    def offer(self, message: str) -> bool:
+        # Неблокирующая постановка сообщения в очередь; False означает, что подписчика нужно отключить
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.policy == "disconnect":
+            return False
+        # "coalesce" заменяет всю накопленную очередь последним сообщением, "drop_oldest" освобождает одно место
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.dropped += 1
+            if self.policy == "drop_oldest":
+                break
+        self.queue.put_nowait(message)
+        return True
+
 # Менеджер для работы с WebSocket соединениями
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[WebSocket, str] = {}  # Хранение активных соединений
+    def __init__(self, max_queue: int = BROADCAST_QUEUE_SIZE, policy: str = SLOW_CONSUMER_POLICY,
+                 backend: Optional[LocalBroadcastBackend] = None):
+        # Политика проверяется при создании менеджера, чтобы ошибка в настройке останавливала запуск приложения
+        if policy not in Subscriber.POLICIES:
+            raise ValueError(f"Неизвестная политика для медленных подписчиков: {policy}")
+        self.max_queue = max_queue
+        self.backend = backend if backend is not None else create_broadcast_backend()  # Транспорт между воркерами
+        self.policy = policy
+        self.active_connections: Dict[WebSocket, Subscriber] = {}  # Хранение активных соединений
+        self.subscribers: Dict[str, Set[Subscriber]] = defaultdict(set)  # Подписчики, сгруппированные по типу данных
+        self.disconnected_slow = 0  # Количество подписчиков, отключённых из-за переполнения очереди
+        self.dropped_messages = 0  # Всего отброшенных сообщений, включая уже отключившихся подписчиков
+        self._closing: Set[asyncio.Task] = set()  # Незавершённые закрытия соединений отключённых подписчиков
 
     async def connect(self, websocket: WebSocket, data_type: str):
         await websocket.accept()  # Принятие WebSocket соединения
-        self.active_connections[websocket] = data_type  # Сохранение соединения и типа данных
+        subscriber = Subscriber(websocket, data_type, self.max_queue, self.policy)
+        self.active_connections[websocket] = subscriber  # Сохранение соединения и типа данных
+        self.subscribers[data_type].add(subscriber)
+        subscriber.task = asyncio.create_task(self._sender(subscriber))  # Отдельная задача отправки для подписчика
 
     def disconnect(self, websocket: WebSocket):
-        # Удаление соединения из активных
-        if websocket in self.active_connections:
-            del self.active_connections[websocket]
+        # Удаление соединения из активных и остановка его задачи отправки
+        subscriber = self.active_connections.pop(websocket, None)
+        if subscriber is None:
+            return
+        group = self.subscribers.get(subscriber.data_type)
+        if group is not None:
+            group.discard(subscriber)
+            if not group:
+                del self.subscribers[subscriber.data_type]
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+
+    async def _sender(self, subscriber: Subscriber):
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                await subscriber.websocket.send_text(message)  # Отправка сообщения
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Соединение закрыто или оборвалось: подписчик больше не получает рассылку
+            self.disconnect(subscriber.websocket)
+
+    def _evict(self, subscriber: Subscriber):
+        # Отключение подписчика, который не успевает получать сообщения
+        self.disconnected_slow += 1
+        self.disconnect(subscriber.websocket)
+        task = asyncio.create_task(self._close(subscriber.websocket))
+        self._closing.add(task)  # Ссылка на задачу не даёт сборщику мусора удалить её до завершения
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # 1013: повторите попытку позже
+        except Exception:
+            pass
+
+    def publish(self, message: str, data_type: str):
+        # Локальная доставка: постановка сообщения в очереди подписчиков нужного типа и подписчиков на "all";
+        # не ждёт отправки и затрагивает только подходящих подписчиков
+        started = time.perf_counter()
+        targets = list(self.subscribers.get(data_type, ()))
+        if data_type != 'all':
+            targets.extend(self.subscribers.get('all', ()))
+        for subscriber in targets:
+            dropped = subscriber.dropped
+            if not subscriber.offer(message):
+                self._evict(subscriber)
+            self.dropped_messages += subscriber.dropped - dropped
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+        BROADCAST_DELIVERIES.inc(len(targets))
 
     async def broadcast(self, message: str, data_type: str):
-        # Отправка сообщения всем подключенным WebSocket соединениям
-        for connection, conn_data_type in self.active_connections.items():
-            if conn_data_type == 'all' or conn_data_type == data_type:
-                await connection.send_text(message)  # Отправка сообщения
+        # Отправка сообщения всем подключенным WebSocket соединениям во всех воркерах
+        await self.backend.publish(message, data_type)
+
+    def stats(self) -> dict:
+        subscribers = list(self.active_connections.values())
+        return {
+            "subscribers": len(subscribers),
+            "data_types": {str(data_type): len(group) for data_type, group in self.subscribers.items()},
+            "queued_messages": sum(subscriber.queue.qsize() for subscriber in subscribers),
+            "dropped_messages": self.dropped_messages,
+            "disconnected_slow": self.disconnected_slow,
+            "policy": self.policy,
+            "backend": type(self.backend).__name__,
+        }
 
 manager = ConnectionManager()  # Создание экземпляра менеджера соединений
 
-# Маршрут для главной страницы, возвращает HTML-код с игроками
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    with get_db() as session:
-        players = session.query(PlayerData.player_name).distinct().all()  # Получение уникальных имен игроков
-    players = [player[0] for player in players]  # Преобразование списка к удобному формату
+# HTML-код главной страницы со списком игроков
+def render_index_page(players: List[str]) -> str:
     return f"""
     <html lang="ru">
     <head>
@@ -156,48 +1280,301 @@ async def index():
         <div class="container">
             <h1>Игроки</h1>
             <div class="player-list">
-            {''.join(f'<div class="player-item"><a href="/player/{player}">{player}</a></div>' for player in players)}
+            {''.join(f'<div class="player-item"><a href="/player/{quote(player)}">{html.escape(player)}</a></div>' for player in players)}
             </div>
         </div>
     </body>
     </html>
     """
 
-# Маршрут для отображения данных конкретного игрока
-@app.get("/player/{player_name}", response_class=HTMLResponse)
-async def player_data(player_name: str, data_type: str = 'all'):
+# Превышение DB_QUERY_TIMEOUT: база перегружена, клиенту стоит повторить запрос позже
+@app.exception_handler(asyncio.TimeoutError)
+async def database_timeout_handler(request: Request, exc: asyncio.TimeoutError):
+    return Response("База данных не ответила вовремя", status_code=503, headers={"Retry-After": "1"})
+
+# Очередь записи переполнена дольше INGEST_PUT_TIMEOUT: клиенту стоит повторить запрос позже
+@app.exception_handler(queue.Full)
+async def ingest_queue_full_handler(request: Request, exc: queue.Full):
+    return Response("Очередь записи переполнена", status_code=503, headers={"Retry-After": "1"})
+
+# Маршрут для главной страницы, возвращает HTML-код с игроками из кэша справочника
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    entry = await get_player_directory("index")
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(entry["html"], headers=headers)
+
+# Маршрут со списком игроков в формате JSON: время первой и последней записи и количество записей по типам
+@app.get("/api/players")
+async def players_api(request: Request):
+    entry = await get_player_directory()
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(entry["json"], media_type="application/json", headers=headers)
+
+# Архивация старых записей. Записи переносятся по месяцам (UTC) в отдельные базы
+# ARCHIVE_DIR/player_data_ГГГГ_ММ.db короткими транзакциями по ARCHIVE_CHUNK записей,
+# затем место в основной базе освобождается через PRAGMA incremental_vacuum.
+# Архивные записи остаются доступны на странице игрока, но не участвуют в полнотекстовом поиске.
+ARCHIVE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS archive.player_data ("
+    "id INTEGER PRIMARY KEY, player_name VARCHAR(50), dialog_text TEXT, data_type VARCHAR(50), timestamp DATETIME)",
+    "CREATE INDEX IF NOT EXISTS archive.ix_player_data_player_ts ON player_data (player_name, timestamp)",
+    "CREATE INDEX IF NOT EXISTS archive.ix_player_data_player_type_ts ON player_data (player_name, data_type, timestamp)",
+]
+
+def archive_file_name(month: str) -> str:
+    return f"player_data_{month.replace('-', '_')}.db"
+
+# Перенос одной порции записей старше cutoff; возвращает количество перенесённых записей.
+# Транзакция над основной базой в режиме WAL и присоединённой архивной базой не атомарна между файлами,
+# поэтому перенос идёт в два шага: сначала копия фиксируется в архиве, затем те же записи удаляются из основной базы.
+# При сбое между шагами записи остаются в обеих базах; повторный перенос безопасен благодаря INSERT OR IGNORE.
+def archive_chunk(connection, cutoff: str, chunk: int = ARCHIVE_CHUNK) -> int:
+    cursor = connection.cursor()
+    try:
+        oldest = cursor.execute(
+            "SELECT substr(timestamp, 1, 7) FROM player_data WHERE timestamp < ? ORDER BY timestamp LIMIT 1", (cutoff,)
+        ).fetchone()
+        if oldest is None:
+            return 0
+        month = oldest[0]
+        year, number = int(month[:4]), int(month[5:7])
+        month_end = f"{year + number // 12:04d}-{number % 12 + 1:02d}"  # Начало следующего месяца
+        selection = "SELECT value FROM json_each(?)"  # Один и тот же набор id для копирования и удаления
+        path = os.path.join(ARCHIVE_DIR, archive_file_name(month))
+        cursor.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            cursor.execute("PRAGMA archive.synchronous=FULL")  # Копия должна быть на диске до удаления оригинала
+            for statement in ARCHIVE_SCHEMA:
+                cursor.execute(statement)
+            # Шаг 1: транзакция изменяет только архивную базу; id выбираются внутри неё
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in cursor.execute(
+                    "SELECT id FROM main.player_data WHERE timestamp < ? AND timestamp < ? ORDER BY timestamp LIMIT ?",
+                    (cutoff, month_end, chunk),
+                )]
+                params = (json.dumps(ids),)
+                cursor.execute(
+                    "INSERT OR IGNORE INTO archive.player_data (id, player_name, dialog_text, data_type, timestamp) "
+                    f"SELECT id, player_name, dialog_text, data_type, timestamp FROM main.player_data WHERE id IN ({selection})",
+                    params,
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        finally:
+            cursor.execute("DETACH DATABASE archive")
+        # Шаг 2: транзакция затрагивает только основную базу
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            count, min_ts, max_ts = cursor.execute(
+                f"SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM player_data WHERE id IN ({selection})", params,
+            ).fetchone()
+            if not count:
+                # Записи уже удалены (например, их перенёс другой процесс) — манифест не меняется
+                cursor.execute("COMMIT")
+                return 0
+            cursor.execute(
+                "INSERT INTO archive_manifest (month, path, row_count, min_timestamp, max_timestamp) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (month) DO UPDATE SET "
+                "row_count = row_count + excluded.row_count, "
+                "min_timestamp = MIN(COALESCE(min_timestamp, excluded.min_timestamp), "
+                "COALESCE(excluded.min_timestamp, min_timestamp)), "
+                "max_timestamp = MAX(COALESCE(max_timestamp, excluded.max_timestamp), "
+                "COALESCE(excluded.max_timestamp, max_timestamp))",
+                (month, archive_file_name(month), count, min_ts, max_ts),
+            )
+            cursor.execute(
+                "INSERT OR IGNORE INTO archive_players (player_name, month) "
+                f"SELECT DISTINCT player_name, ? FROM player_data WHERE id IN ({selection}) AND player_name IS NOT NULL",
+                (month,) + params,
+            )
+            cursor.execute(f"DELETE FROM player_data WHERE id IN ({selection})", params)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute(f"PRAGMA incremental_vacuum({ARCHIVE_VACUUM_PAGES})")
+        return count
+    finally:
+        cursor.close()
+
+# Перенос всех записей старше cutoff порциями с паузами между транзакциями.
+# Архивацию запускает каждый воркер, поэтому одновременно работает только один из них:
+# блокировка удерживается транзакцией в служебной базе ARCHIVE_DIR/archiver.lock и снимается при завершении процесса.
+def archive_old_rows(cutoff: datetime) -> int:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    lock = sqlite3.connect(os.path.join(ARCHIVE_DIR, "archiver.lock"), timeout=0, isolation_level=None)
+    try:
+        lock.execute("BEGIN EXCLUSIVE")
+    except sqlite3.OperationalError:
+        lock.close()
+        logger.info("Архивация уже выполняется другим процессом")
+        return 0
+    cutoff_str = cutoff.strftime("%Y-%m-%d %H:%M:%S.%f")
+    moved = 0
+    try:
+        connection = engine.raw_connection()
+        try:
+            while True:
+                count = archive_chunk(connection, cutoff_str)
+                if not count:
+                    break
+                moved += count
+                time.sleep(ARCHIVE_PAUSE)
+        finally:
+            connection.close()
+    finally:
+        lock.close()
+    if moved:
+        logger.info("В архив перенесено %d записей старше %s", moved, cutoff_str)
+    return moved
+
+# Периодический запуск архивации в фоне
+async def run_archiver():
+    while True:
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_RETENTION_DAYS)
+            await asyncio.to_thread(archive_old_rows, cutoff)
+        except Exception:
+            logger.exception("Ошибка архивации")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+HistoryRow = namedtuple("HistoryRow", ["id", "timestamp", "dialog_text", "data_type"])  # Запись истории из архива
+
+# Чтение страницы истории игрока из архивных баз, от новых месяцев к старым. Открываются только базы
+# месяцев, в которых есть записи игрока; since ограничивает выборку записями не старше этой метки (None — без ограничения).
+def fetch_archived_page(player_name: str, data_type: str, cursor, limit: int,
+                        since: Optional[datetime] = None) -> list:
     with get_db() as session:
-        # Запрос данных игрока в зависимости от типа
-        if data_type == 'all':
-            player_data = session.query(PlayerData).filter_by(player_name=player_name).order_by(PlayerData.timestamp.desc()).all()
-        else:
-            player_data = session.query(PlayerData).filter_by(player_name=player_name, data_type=data_type).order_by(PlayerData.timestamp.desc()).all()
-    
-        # Словарь для отображения названий месяцев на русском
-        month_names = {
-            1: "января", 2: "февраля", 3: "марта", 4: "апреля", 5: "мая", 6: "июня",
-            7: "июля", 8: "августа", 9: "сентября", 10: "октября", 11: "ноября", 12: "декабря"
-        }
+        query = session.query(ArchiveSegment.path) \
+            .join(ArchivePlayer, ArchivePlayer.month == ArchiveSegment.month) \
+            .filter(ArchivePlayer.player_name == player_name)
+        if cursor is not None:
+            query = query.filter(ArchiveSegment.min_timestamp <= cursor[0])
+        if since is not None:
+            query = query.filter(ArchiveSegment.max_timestamp >= since)
+        segments = [row.path for row in query.order_by(ArchiveSegment.month.desc())]
+    rows: List[HistoryRow] = []
+    for path in segments:
+        sql = "SELECT id, timestamp, dialog_text, data_type FROM player_data WHERE player_name = ?"
+        params: list = [player_name]
+        if data_type != 'all':
+            sql += " AND data_type = ?"
+            params.append(data_type)
+        if cursor is not None:
+            sql += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+            timestamp = cursor[0].strftime("%Y-%m-%d %H:%M:%S.%f")
+            params += [timestamp, timestamp, cursor[1]]
+        if since is not None:
+            sql += " AND timestamp >= ?"
+            params.append(since.strftime("%Y-%m-%d %H:%M:%S.%f"))
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit - len(rows))
+        connection = sqlite3.connect(f"file:{os.path.join(ARCHIVE_DIR, path)}?mode=ro", uri=True)
+        try:
+            for row_id, timestamp, dialog_text, row_type in connection.execute(sql, params):
+                rows.append(HistoryRow(row_id, datetime.fromisoformat(timestamp), dialog_text, row_type))
+        finally:
+            connection.close()
+        if len(rows) >= limit:
+            break
+    return rows
+
+# Курсор постраничного вывода: временная метка и id последней показанной записи.
+# Страницы выбираются по ключу (timestamp, id), поэтому стоимость запроса не зависит от номера страницы.
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    return f"{timestamp.isoformat()},{row_id}"
+
+def decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+# Выборка одной страницы истории игрока, от новых записей к старым.
+# Основная база может содержать записи старше архивных (например, поздно доставленные пакеты),
+# поэтому страница собирается слиянием порций из основной базы и архива по ключу (timestamp, id).
+def fetch_player_page(player_name: str, data_type: str, cursor, limit: int) -> list:
+    rows = fetch_hot_page(player_name, data_type, cursor, limit)
+    # При полной порции из основной базы из архива нужны только записи не старше её последней записи
+    since = rows[-1].timestamp if len(rows) >= limit else None
+    archived = fetch_archived_page(player_name, data_type, cursor, limit, since)
+    if not archived:
+        return rows
+    # После сбоя архивации запись может временно находиться в обеих базах
+    merged = {(row.timestamp, row.id): row for row in archived}
+    merged.update(((row.timestamp, row.id), row) for row in rows)
+    return [merged[key] for key in sorted(merged, reverse=True)[:limit]]
+
+# Выборка страницы истории игрока из основной базы
+def fetch_hot_page(player_name: str, data_type: str, cursor, limit: int) -> list:
+    with get_db() as session:
+        query = session.query(PlayerData.id, PlayerData.timestamp, PlayerData.dialog_text, PlayerData.data_type) \
+            .filter(PlayerData.player_name == player_name)
+        if data_type != 'all':
+            query = query.filter(PlayerData.data_type == data_type)
+        if cursor is not None:
+            timestamp, row_id = cursor
+            query = query.filter(or_(
+                PlayerData.timestamp < timestamp,
+                and_(PlayerData.timestamp == timestamp, PlayerData.id < row_id),
+            ))
+        return query.order_by(PlayerData.timestamp.desc(), PlayerData.id.desc()).limit(limit).all()
+
+# Страница истории игрока: записи перебираются порциями по HISTORY_FETCH_SIZE, в памяти одновременно
+# находится только одна порция. После перебора next_cursor содержит курсор следующей страницы
+# (или None, если записей больше нет).
+class PlayerHistory:
+    def __init__(self, player_name: str, data_type: str, cursor, limit: int):
+        self.player_name = player_name
+        self.data_type = data_type
+        self.cursor = cursor
+        self.limit = limit
+        self.next_cursor: Optional[str] = None
+
+    async def __aiter__(self):
+        cursor = self.cursor
+        remaining = self.limit
+        while remaining > 0:
+            want = min(HISTORY_FETCH_SIZE, remaining)
+            rows = await db.run(fetch_player_page, self.player_name, self.data_type, cursor, want + 1)  # Лишняя запись показывает, есть ли продолжение
+            more = len(rows) > want
+            rows = rows[:want]
+            for row in rows:
+                yield row
+            remaining -= len(rows)
+            if not more:
+                return
+            cursor = (rows[-1].timestamp, rows[-1].id)
+        self.next_cursor = encode_cursor(*cursor)
 
-        player_data_html = ""  # HTML-код для отображения данных игрока
-        last_date = None  # Переменная для отслеживания последней даты
-        current_table_html = ""  # HTML-код для текущей таблицы данных
-
-        moscow_tz = pytz.timezone('Europe/Moscow')  # Установка часового пояса
-
-        # Обработка данных игрока
-        for data in player_data:
-            moscow_time = data.timestamp.astimezone(moscow_tz)  # Приведение времени к московскому
-            date_str = moscow_time.strftime('%d %m %Y')  # Форматирование даты
-            day, month, year = date_str.split()  # Разделение даты на части
-            month_russian = month_names[int(month)]  # Получение названия месяца на русском
-            formatted_date = f"{day} {month_russian} {year} года"  # Форматирование даты для отображения
-            time_str = moscow_time.strftime('%H:%M:%S')  # Форматирование времени
-
-            # Проверка на изменение даты для отображения
-            if last_date != formatted_date:
-                if current_table_html:
-                    player_data_html += f"""
+def clamp_page_size(limit: Optional[int]) -> int:
+    if limit is None:
+        return HISTORY_PAGE_SIZE
+    return max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+# Форматирование даты и времени записи по московскому времени без strftime/split
+def format_moscow_time(timestamp: datetime):
+    moscow_time = timestamp.astimezone(MOSCOW_TZ)  # Приведение времени к московскому
+    formatted_date = f"{moscow_time.day:02d} {MONTH_NAMES[moscow_time.month]} {moscow_time.year} года"
+    time_str = f"{moscow_time.hour:02d}:{moscow_time.minute:02d}:{moscow_time.second:02d}"
+    return formatted_date, time_str
+
+# HTML-код раздела с записями за один день
+def render_date_section(formatted_date: str, rows_html: List[str]) -> str:
+    return f"""
+                <div class="date-section">
+                    <h2 class="date-header">{formatted_date}</h2>
                     <table class="data-table">
                         <thead>
                             <tr>
@@ -205,59 +1582,267 @@ async def player_data(player_name: str, data_type: str = 'all'):
                                 <th>Текст</th>
                             </tr>
                         </thead>
-                        <tbody>
-                            {current_table_html}  # Добавление текущей таблицы в HTML
+                        <tbody>{''.join(rows_html)}
                         </tbody>
                     </table>
-                    </div>"""
-
-                player_data_html += f"""
-                <div class="date-section">
-                    <h2 class="date-header">{formatted_date}</h2>  # Заголовок с датой
-                """
-                current_table_html = ""  # Сброс текущей таблицы
-                last_date = formatted_date  # Обновление последней даты
-
-            current_table_html += f"""
-            <tr>
-                <td class="time">{time_str}</td>  # Отображение времени
-                <td class="dialog-text">{data.dialog_text}</td>  # Отображение текста диалога
-            </tr>"""
-
-        # Добавление оставшейся таблицы, если она есть
-        if current_table_html:
-            player_data_html += f"""
-            <table class="data-table">
-                <thead>
-                    <tr>
-                        <th>Время</th>
-                        <th>Текст</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {current_table_html}
-                </tbody>
-            </table>
-            </div>"""
+                </div>"""
 
-    return f"""
+# Потоковая отрисовка страницы игрока: каждый день отправляется клиенту, как только он готов
+async def render_player_page(player_name: str, data_type: str, cursor, limit: int):
+    name = html.escape(player_name)
+    yield f"""
     <html lang="ru">
     <head>
-        <title>Данные игрока: {player_name}</title>
-        <link rel="stylesheet" href="/static/style.css">  # Подключение стилей
+        <title>Данные игрока: {name}</title>
+        <link rel="stylesheet" href="/static/style.css">
         <script>
-            let socket = new WebSocket("ws://localhost:8000/ws?data_type={data_type}");  # Установка WebSocket соединения
+            let socket = new WebSocket("ws://localhost:8000/ws?data_type={quote(data_type)}");
         </script>
     </head>
     <body>
         <div class="container">
-            <h1>Данные игрока: {player_name}</h1>
-            {player_data_html}  # Отображение данных игрока
+            <h1>Данные игрока: {name}</h1>"""
+
+    last_date = None  # Дата текущего раздела
+    rows_html: List[str] = []  # Строки таблицы текущего раздела
+    history = PlayerHistory(player_name, data_type, cursor, limit)
+    async for row in history:
+        formatted_date, time_str = format_moscow_time(row.timestamp)
+        if last_date != formatted_date:
+            if rows_html:
+                yield render_date_section(last_date, rows_html)
+            rows_html = []
+            last_date = formatted_date
+        rows_html.append(f"""
+                            <tr>
+                                <td class="time">{time_str}</td>
+                                <td class="dialog-text">{html.escape(row.dialog_text or '')}</td>
+                            </tr>""")
+    if rows_html:
+        yield render_date_section(last_date, rows_html)
+
+    if history.next_cursor is not None:
+        params = urlencode({"data_type": data_type, "limit": limit, "cursor": history.next_cursor})
+        yield f"""
+            <a class="back-button" href="/player/{quote(player_name)}?{params}">Более ранние записи</a>"""
+    yield """
         </div>
     </body>
     </html>
     """
 
+# Маршрут для отображения данных конкретного игрока (постранично, потоковым HTML)
+@app.get("/player/{player_name}", response_class=HTMLResponse)
+async def player_data(player_name: str, data_type: str = 'all', limit: Optional[int] = Query(None, ge=1),
+                      cursor: Optional[str] = None):
+    page_cursor = decode_cursor(cursor)
+    return StreamingResponse(
+        render_player_page(player_name, data_type, page_cursor, clamp_page_size(limit)),
+        media_type="text/html; charset=utf-8",
+    )
+
+# Маршрут с историей игрока в формате JSON (постранично)
+@app.get("/api/player/{player_name}")
+async def player_data_api(player_name: str, data_type: str = 'all', limit: Optional[int] = Query(None, ge=1),
+                          cursor: Optional[str] = None):
+    page_cursor = decode_cursor(cursor)
+    items = []
+    history = PlayerHistory(player_name, data_type, page_cursor, clamp_page_size(limit))
+    async for row in history:
+        items.append({
+            "id": row.id,
+            "timestamp": row.timestamp.isoformat(),
+            "dialog_text": row.dialog_text,
+            "data_type": row.data_type,
+        })
+    return {"player_name": player_name, "data_type": data_type, "items": items, "next_cursor": history.next_cursor}
+
+# Преобразование строки поиска в запрос FTS5: каждое слово берётся в кавычки, чтобы символы
+# синтаксиса FTS5 во вводе пользователя не вызывали ошибок; "*" в конце слова означает поиск по префиксу
+def build_fts_query(q: str) -> str:
+    terms = []
+    for word in q.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def decode_search_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+# Поиск по тексту диалогов. Страницы идут от новых записей к старым по id (курсор — id последней записи страницы),
+# поэтому курсор не сдвигается при добавлении данных, а внутри страницы записи упорядочены по релевантности bm25.
+# Запрос выполняется в два шага: сначала FTS5 выдаёт id страницы в порядке rowid без вычисления ранга,
+# затем snippet() и bm25() вычисляются только для записей этой страницы, а не для всех совпадений.
+# Возвращает записи страницы и курсор следующей страницы (или None).
+def search_player_data(match: str, player_name: Optional[str], data_type: Optional[str],
+                       since: Optional[datetime], until: Optional[datetime], cursor: Optional[int], limit: int):
+    conditions = ["player_data_fts MATCH :match"]
+    params = {"match": match, "tokens": SEARCH_SNIPPET_TOKENS}
+    if player_name:
+        conditions.append("p.player_name = :player_name")
+        params["player_name"] = player_name
+    if data_type and data_type != 'all':
+        conditions.append("p.data_type = :data_type")
+        params["data_type"] = data_type
+    if since is not None:
+        conditions.append("p.timestamp >= :since")
+        params["since"] = to_utc_naive(since).strftime("%Y-%m-%d %H:%M:%S.%f")
+    if until is not None:
+        conditions.append("p.timestamp < :until")
+        params["until"] = to_utc_naive(until).strftime("%Y-%m-%d %H:%M:%S.%f")
+    where = " AND ".join(conditions)
+    with get_db() as session:
+        page = "AND player_data_fts.rowid < :cursor" if cursor is not None else ""
+        ids = session.execute(text(f"""
+            SELECT player_data_fts.rowid FROM player_data_fts JOIN player_data AS p ON p.id = player_data_fts.rowid
+            WHERE {where} {page}
+            ORDER BY player_data_fts.rowid DESC
+            LIMIT :limit
+        """), {**params, "cursor": cursor, "limit": limit + 1}).scalars().all()  # Лишняя запись показывает, есть ли продолжение
+        if not ids:
+            return [], None
+        next_cursor = None
+        if len(ids) > limit:
+            ids = ids[:limit]
+            next_cursor = str(ids[-1])
+        # Диапазон id страницы вместе с теми же условиями выбирает ровно записи страницы
+        rows = session.execute(text(f"""
+            SELECT p.id AS id, p.player_name, p.data_type, p.timestamp,
+                   snippet(player_data_fts, 0, char(2), char(3), '…', :tokens) AS snippet,
+                   bm25(player_data_fts) AS rank
+            FROM player_data_fts JOIN player_data AS p ON p.id = player_data_fts.rowid
+            WHERE {where} AND player_data_fts.rowid BETWEEN :first AND :last
+            ORDER BY rank, id DESC
+        """).columns(
+            id=Integer, player_name=String, data_type=String, timestamp=DateTime, snippet=Text,
+        ), {**params, "first": ids[-1], "last": ids[0]}).fetchall()
+    return rows, next_cursor
+
+# Маршрут полнотекстового поиска по диалогам всех игроков.
+# Фрагменты текста экранированы, совпадения выделены тегом <mark>.
+@app.get("/api/search")
+async def search(q: str, player: Optional[str] = None, data_type: Optional[str] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None):
+    match = build_fts_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="Пустой поисковый запрос")
+    page_size = min(limit or SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+    rows, next_cursor = await db.run(search_player_data, match, player, data_type, since, until,
+                                     decode_search_cursor(cursor), page_size)
+    items = [{
+        "id": row.id,
+        "player_name": row.player_name,
+        "data_type": row.data_type,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        "snippet": html.escape(row.snippet or "").replace("\x02", "<mark>").replace("\x03", "</mark>"),
+        "rank": row.rank,
+    } for row in rows]
+    return {"query": q, "items": items, "next_cursor": next_cursor}
+
+# Маршрут для добавления одной записи через HTTP
+@app.post("/player_data", status_code=202)
+async def add_player_data(item: PlayerDataIn):
+    record = record_from_input(item)
+    await ingest_queue.put(record)  # Запись попадает в ту же очередь, что и данные из WebSocket
+    message = json.dumps({
+        "player_name": item.player_name,
+        "dialog_text": item.dialog_text,
+        "data_type": item.data_type,
+    }, ensure_ascii=False)
+    await manager.broadcast(message, item.data_type)  # Рассылка данных подключенным пользователям
+    return {"status": "queued"}
+
+# Маршрут для пакетной загрузки записей в формате NDJSON (одна JSON-запись на строку).
+# Тело запроса читается потоком и записывается пакетами по INGEST_HTTP_CHUNK строк,
+# поэтому весь файл никогда не загружается в память. Рассылка по WebSocket не выполняется:
+# загрузка предназначена для повторной отправки накопленных данных.
+@app.post("/player_data/batch")
+async def add_player_data_batch(request: Request):
+    batches = []  # Статистика по каждому пакету
+    errors = []  # Первые ошибки разбора строк
+    chunk: List[dict] = []
+    rejected = 0  # Отклонённые строки текущего пакета
+    line_no = 0
+    buffer = b""
+
+    async def flush():
+        nonlocal chunk, rejected
+        accepted = len(chunk)
+        if chunk:
+            try:
+                if await db.run_to_completion(bulk_insert_player_data, chunk):
+                    await announce_players()
+            except Exception as exc:
+                logger.exception("Не удалось записать пакет из %d записей", len(chunk))
+                rejected += accepted
+                accepted = 0
+                if len(errors) < INGEST_MAX_ERRORS:
+                    errors.append({"batch": len(batches) + 1, "error": str(exc)})
+        batches.append({"batch": len(batches) + 1, "accepted": accepted, "rejected": rejected})
+        INGEST_ROWS.inc(accepted, source="batch", result="stored")
+        INGEST_ROWS.inc(rejected, source="batch", result="rejected")
+        chunk, rejected = [], 0
+
+    def parse(line: bytes):
+        nonlocal rejected
+        line = line.strip()
+        if not line:
+            return
+        try:
+            chunk.append(record_from_input(PlayerDataIn(**json.loads(line))))
+        except (ValueError, TypeError, ValidationError) as exc:
+            rejected += 1
+            if len(errors) < INGEST_MAX_ERRORS:
+                errors.append({"line": line_no, "error": str(exc)})
+
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")  # Последняя (возможно неполная) строка остаётся в буфере
+        for line in lines:
+            line_no += 1
+            parse(line)
+            if len(chunk) + rejected >= INGEST_HTTP_CHUNK:
+                await flush()
+    if buffer:
+        line_no += 1
+        parse(buffer)
+    if chunk or rejected:
+        await flush()
+
+    return {
+        "accepted": sum(batch["accepted"] for batch in batches),
+        "rejected": sum(batch["rejected"] for batch in batches),
+        "batches": batches,
+        "errors": errors,
+    }
+
+# Маршрут со статистикой очереди записи: глубина очереди и задержка сброса пакетов
+@app.get("/ingest/stats")
+async def ingest_stats():
+    return {**ingest_queue.stats(), "broadcast": manager.stats()}
+
+# Показатели, которые читаются в момент запроса /metrics
+metrics.register(Gauge("ingest_queue_depth", "Записи, ожидающие сброса в базу", lambda: ingest_queue._queue.qsize()))
+metrics.register(Gauge("websocket_subscribers", "Подключенные WebSocket подписчики",
+                       lambda: len(manager.active_connections)))
+metrics.register(Gauge("broadcast_queued_messages", "Сообщения в очередях подписчиков",
+                       lambda: sum(sub.queue.qsize() for sub in list(manager.active_connections.values()))))
+metrics.register(Gauge("broadcast_dropped_messages", "Сообщения, отброшенные у медленных подписчиков",
+                       lambda: manager.dropped_messages))
+
+# Маршрут с метриками в текстовом формате Prometheus
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Маршрут для обработки WebSocket соединений
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -267,18 +1852,34 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         while True:
             data = await websocket.receive_text()  # Ожидание получения текста
-            data_dict = json.loads(data)  # Преобразование строки в словарь
-            player_data = PlayerData(**data_dict)  # Создание объекта PlayerData
-            with get_db() as session:
-                session.add(player_data)  # Добавление данных в сессию
-                session.commit()  # Коммит изменений
+            try:
+                data_dict = json.loads(data)  # Преобразование строки в словарь
+                item = PlayerDataIn(**data_dict)  # Проверка входящих данных
+            except (ValueError, TypeError, ValidationError) as exc:
+                # Некорректное сообщение отклоняется, соединение продолжает работать
+                INGEST_ROWS.inc(source="websocket", result="rejected")
+                await websocket.send_text(json.dumps({"error": str(exc)}, ensure_ascii=False))
+                continue
+            try:
+                await ingest_queue.put(record_from_input(item))  # Постановка записи в очередь пакетной записи
+            except queue.Full:
+                # Очередь записи переполнена дольше INGEST_PUT_TIMEOUT: отправитель должен переподключиться позже
+                await websocket.close(code=1013)  # 1013: повторите попытку позже
+                return
+            INGEST_ROWS.inc(source="websocket", result="queued")
             await manager.broadcast(data, data_type)  # Рассылка данных всем подключенным пользователям
     except WebSocketDisconnect:
         manager.disconnect(websocket)  # Отключение WebSocket
         await manager.broadcast(json.dumps({"message": "Пользователь отключился."}), data_type)  # Рассылка сообщения об отключении
+    finally:
+        manager.disconnect(websocket)  # Соединение не остаётся в рассылке и при других ошибках
 
 # Запуск приложения с uvicorn
 # Команда для запуска: uvicorn main:app --reload
+# Команда обслуживания: python app/main.py vacuum (включает auto_vacuum=INCREMENTAL для существующей базы)
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    if sys.argv[1:] == ["vacuum"]:
+        enable_incremental_vacuum()
+    else:
+        import uvicorn
+        uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
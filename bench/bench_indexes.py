@@ -0,0 +1,153 @@
+"""
+Сравнение планов запросов и задержек для таблицы player_data до и после миграций схемы.
+
+Скрипт создаёт временную базу со старой схемой (одиночные индексы по id и player_name),
+заполняет её синтетическими данными, измеряет типичные запросы приложения, затем импортирует
+app/main.py с DATABASE_URL, указывающим на эту базу (при импорте применяются миграции на месте),
+и повторяет измерения уже с новыми индексами и настройками соединения.
+
+Запуск из корня репозитория:
+    python bench/bench_indexes.py --rows 500000 --players 200
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Схема таблицы в том виде, в каком её создавали версии приложения до миграций
+OLD_SCHEMA = [
+    """CREATE TABLE player_data (
+        id INTEGER NOT NULL,
+        player_name VARCHAR(50),
+        dialog_text TEXT,
+        data_type VARCHAR(50),
+        timestamp DATETIME,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX ix_player_data_id ON player_data (id)",
+    "CREATE INDEX ix_player_data_player_name ON player_data (player_name)",
+]
+
+DATA_TYPES = ["диалог", "ввод", "событие", "система"]
+
+# Запросы, которые выполняет приложение: страница истории игрока (все типы и один тип) и список игроков
+QUERIES = {
+    "history_all": (
+        "SELECT id, timestamp, dialog_text, data_type FROM player_data WHERE player_name = :player "
+        "ORDER BY timestamp DESC, id DESC LIMIT 201"
+    ),
+    "history_type": (
+        "SELECT id, timestamp, dialog_text, data_type FROM player_data WHERE player_name = :player "
+        "AND data_type = :data_type ORDER BY timestamp DESC, id DESC LIMIT 201"
+    ),
+    "history_type_next_page": (
+        "SELECT id, timestamp, dialog_text, data_type FROM player_data WHERE player_name = :player "
+        "AND data_type = :data_type AND (timestamp < :ts OR (timestamp = :ts AND id < :id)) "
+        "ORDER BY timestamp DESC, id DESC LIMIT 201"
+    ),
+    "distinct_players": "SELECT DISTINCT player_name FROM player_data",
+}
+
+
+def populate(path: str, rows: int, players: int):
+    connection = sqlite3.connect(path)
+    for statement in OLD_SCHEMA:
+        connection.execute(statement)
+    start = datetime(2024, 1, 1)
+    rnd = random.Random(42)
+
+    def generate():
+        for i in range(rows):
+            yield (
+                f"player{rnd.randrange(players)}",
+                f"Текст диалога номер {i}",
+                rnd.choice(DATA_TYPES),
+                (start + timedelta(seconds=i * 7)).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            )
+
+    connection.executemany(
+        "INSERT INTO player_data (player_name, dialog_text, data_type, timestamp) VALUES (?, ?, ?, ?)", generate()
+    )
+    connection.commit()
+    connection.close()
+
+
+def measure(connection: sqlite3.Connection, repeat: int, players: int) -> dict:
+    rnd = random.Random(7)
+    results = {}
+    for name, sql in QUERIES.items():
+        plan = [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, _params(rnd, players))]
+        timings = []
+        for _ in range(repeat if name != "distinct_players" else max(1, repeat // 10)):
+            params = _params(rnd, players)
+            started = time.perf_counter()
+            connection.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = (plan, statistics.median(timings), max(timings))
+    return results
+
+
+def _params(rnd: random.Random, players: int) -> dict:
+    return {
+        "player": f"player{rnd.randrange(players)}",
+        "data_type": rnd.choice(DATA_TYPES),
+        "ts": "2024-03-01 00:00:00.000000",
+        "id": 10 ** 9,
+    }
+
+
+def report(title: str, results: dict):
+    print(f"\n== {title} ==")
+    for name, (plan, median, worst) in results.items():
+        print(f"{name:24s} median {median:9.3f} ms   max {worst:9.3f} ms")
+        for step in plan:
+            print(f"    {step}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="количество записей в таблице")
+    parser.add_argument("--players", type=int, default=100, help="количество игроков")
+    parser.add_argument("--repeat", type=int, default=50, help="повторов каждого запроса")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "game_data.db")
+        print(f"Заполнение {args.rows} записей...")
+        populate(path, args.rows, args.players)
+
+        connection = sqlite3.connect(path)
+        before = measure(connection, args.repeat, args.players)
+        connection.close()
+        report("До миграций", before)
+
+        # Импорт приложения применяет миграции к этой же базе на месте
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        os.chdir(ROOT)  # Приложение ищет каталог static относительно текущего каталога
+        sys.path.insert(0, os.path.join(ROOT, "app"))
+        started = time.perf_counter()
+        import main as app_main
+        print(f"\nМиграции применены за {time.perf_counter() - started:.2f} с")
+
+        connection = sqlite3.connect(path)
+        app_main.configure_sqlite_connection(connection)
+        after = measure(connection, args.repeat, args.players)
+        connection.close()
+        app_main.engine.dispose()
+        report("После миграций", after)
+
+        print("\n== Ускорение (медиана) ==")
+        for name in QUERIES:
+            print(f"{name:24s} x{before[name][1] / max(after[name][1], 1e-6):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Генератор нагрузки и набор измерений для приложения.
+
+Приложение запускается в этом же процессе (через TestClient) на временной базе.
+N производителей отправляют записи через WebSocket, M зрителей на каждый тип данных
+принимают рассылку, а отдельный поток в это же время запрашивает страницы /player/{player_name}
+(история отдаётся одновременно с приёмом и рассылкой). После записи страницы запрашиваются ещё раз без нагрузки.
+Скрипт выводит пропускную способность и перцентили задержек:
+    - запись: скорость приёма и время сохранения всех записей, время пакетной вставки (из метрик);
+    - рассылка: задержка от отправки производителем до получения зрителем, время постановки в очереди (из метрик);
+    - отрисовка страницы игрока: полное время ответа во время записи и без нагрузки.
+
+Записи можно воспроизвести из файла JSONL (по одной записи PlayerDataIn на строку), иначе генерируются случайные.
+
+Запуск из корня репозитория:
+    python bench/loadgen.py --producers 8 --viewers 4 --messages 2000
+    python bench/loadgen.py --replay traffic.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STOP = "__bench_stop__"  # Служебное сообщение, завершающее приём у зрителей
+
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return "нет данных"
+    samples = sorted(samples)
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+
+    return (f"p50 {pick(0.50):8.2f} мс  p90 {pick(0.90):8.2f} мс  p99 {pick(0.99):8.2f} мс  "
+            f"max {samples[-1] * 1000:8.2f} мс  (n={len(samples)})")
+
+
+def histogram_percentiles(histogram, **labels) -> str:
+    values = [histogram.quantile(q, **labels) for q in (0.5, 0.9, 0.99)]
+    if values[0] is None:
+        return "нет данных"
+    return "  ".join(f"{name} {value * 1000:8.2f} мс" for name, value in zip(("p50", "p90", "p99"), values))
+
+
+def rejected(app_main) -> float:
+    return app_main.INGEST_ROWS.value(source="websocket", result="rejected")
+
+
+def processed(app_main) -> float:
+    # Записи, по которым сервер уже принял окончательное решение
+    return app_main.ingest_queue.flushed_rows + app_main.ingest_queue.failed_rows + rejected(app_main)
+
+
+def load_records(args) -> list:
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as replay:
+            return [json.loads(line) for line in replay if line.strip()]
+    rnd = random.Random(42)
+    return [{
+        "player_name": f"player{rnd.randrange(args.players)}",
+        "dialog_text": f"Текст диалога {i} " + "x" * rnd.randrange(20, 200),
+        "data_type": rnd.choice(args.data_types),
+    } for i in range(args.messages * args.producers)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--producers", type=int, default=4, help="количество WebSocket производителей")
+    parser.add_argument("--viewers", type=int, default=2, help="зрителей на каждый тип данных")
+    parser.add_argument("--messages", type=int, default=1000, help="сообщений на производителя (без --replay)")
+    parser.add_argument("--players", type=int, default=20, help="количество игроков (без --replay)")
+    parser.add_argument("--data-types", default="dialog,input,chat", help="типы данных через запятую")
+    parser.add_argument("--replay", help="файл JSONL с записями для воспроизведения")
+    parser.add_argument("--page-requests", type=int, default=50, help="запросов страницы игрока")
+    parser.add_argument("--page-size", type=int, default=500, help="параметр limit страницы игрока")
+    parser.add_argument("--drain-timeout", type=float, default=60.0,
+                        help="сколько ждать сохранения всех записей после отправки, сек")
+    args = parser.parse_args()
+    args.data_types = [data_type for data_type in args.data_types.split(",") if data_type]
+
+    directory = tempfile.mkdtemp(prefix="loadgen-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'game_data.db')}"
+    os.environ.setdefault("BROADCAST_QUEUE_SIZE", "100000")  # Зрители генератора не должны терять сообщения
+    os.chdir(ROOT)  # Приложение ищет каталог static относительно текущего каталога
+    sys.path.insert(0, os.path.join(ROOT, "app"))
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    records = load_records(args)
+    data_types = sorted({str(record.get("data_type", "")) for record in records})  # Записи воспроизведения могут быть некорректными
+    # Записи распределяются по производителям; каждый производитель подписан на один тип данных
+    queues = {index: [] for index in range(args.producers)}
+    producer_types = {index: data_types[index % len(data_types)] for index in range(args.producers)}
+    by_type = {data_type: [record for record in records if str(record.get("data_type", "")) == data_type]
+               for data_type in data_types}
+    producers_of = {data_type: [i for i, t in producer_types.items() if t == data_type] for data_type in data_types}
+    for data_type, items in by_type.items():
+        owners = producers_of[data_type] or [0]
+        for record, owner in zip(items, itertools.cycle(owners)):
+            queues[owner].append(record)
+    expected = {data_type: sum(len(queues[i]) for i in producers_of[data_type]) for data_type in data_types}
+
+    broadcast_latency = []
+    latency_lock = threading.Lock()
+
+    with TestClient(app_main.app) as client:
+        ready = threading.Barrier(len(data_types) * args.viewers + 1)
+
+        def viewer(data_type):
+            with client.websocket_connect(f"/ws?data_type={data_type}") as websocket:
+                ready.wait()
+                samples = []
+                while True:
+                    message = json.loads(websocket.receive_text())
+                    if message.get("dialog_text") == STOP:
+                        break
+                    if "bench_ts" in message:
+                        samples.append(time.perf_counter() - message["bench_ts"])
+                with latency_lock:
+                    broadcast_latency.extend(samples)
+
+        players = sorted({str(record.get("player_name", "")) for record in records})
+        producing = threading.Event()
+
+        def render_page(i):
+            page_started = time.perf_counter()
+            response = client.get(f"/player/{players[i % len(players)]}", params={"limit": args.page_size})
+            response.read()
+            return time.perf_counter() - page_started
+
+        def page_reader(samples):
+            # Запросы истории во время записи и рассылки
+            for i in itertools.count():
+                if not producing.is_set():
+                    break
+                samples.append(render_page(i))
+
+        def producer(index):
+            with client.websocket_connect(f"/ws?data_type={producer_types[index]}") as websocket:
+                for record in queues[index]:
+                    websocket.send_text(json.dumps({**record, "bench_ts": time.perf_counter()}, ensure_ascii=False))
+
+        viewers = [threading.Thread(target=viewer, args=(data_type,))
+                   for data_type in data_types for _ in range(args.viewers)]
+        for thread in viewers:
+            thread.start()
+        ready.wait()
+
+        started = time.perf_counter()
+        busy_page_latency = []
+        producing.set()
+        reader = threading.Thread(target=page_reader, args=(busy_page_latency,))
+        producers = [threading.Thread(target=producer, args=(index,)) for index in range(args.producers)]
+        for thread in producers:
+            thread.start()
+        reader.start()
+        for thread in producers:
+            thread.join()
+        sent = time.perf_counter() - started
+
+        # Некорректные записи сервер отклоняет, поэтому ждём, пока каждая запись будет сохранена,
+        # не записана или отклонена, но не дольше --drain-timeout
+        total = len(records)
+        deadline = time.monotonic() + args.drain_timeout
+        while processed(app_main) < total and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stored = time.perf_counter() - started
+        producing.clear()
+        reader.join()
+        if processed(app_main) < total:
+            print(f"Внимание: за {args.drain_timeout:.0f} с обработано {processed(app_main):.0f} записей из {total}")
+
+        for data_type in data_types:
+            stop = json.dumps({"dialog_text": STOP, "data_type": data_type})
+            client.portal.call(app_main.manager.broadcast, stop, data_type)
+        for thread in viewers:
+            thread.join()
+
+        page_latency = [render_page(i) for i in range(args.page_requests)]
+
+    print(f"Записей: {total}, производителей: {args.producers}, зрителей: {len(viewers)} "
+          f"({args.viewers} на тип, типов: {len(data_types)})")
+    print("\n== Запись ==")
+    print(f"приём через WebSocket   {total / sent:10.0f} записей/с ({sent:.2f} с)")
+    print(f"сохранение в базу       {total / stored:10.0f} записей/с ({stored:.2f} с)")
+    print(f"пакетная вставка        {histogram_percentiles(app_main.INGEST_FLUSH_SECONDS)}")
+    print(f"пакетов: {app_main.ingest_queue.flushed_batches}, ошибок записи: {app_main.ingest_queue.failed_rows}, "
+          f"отклонено: {rejected(app_main):.0f}")
+    print("\n== Рассылка ==")
+    print(f"доставлено сообщений    {len(broadcast_latency)} из {sum(expected[t] * args.viewers for t in data_types)}")
+    print(f"отправка -> получение   {percentiles(broadcast_latency)}")
+    print(f"постановка в очереди    {histogram_percentiles(app_main.BROADCAST_SECONDS)}")
+    print(f"\n== Страница игрока (limit={args.page_size}) ==")
+    print(f"во время записи         {percentiles(busy_page_latency)}")
+    print(f"без нагрузки            {percentiles(page_latency)}")
+    app_main.engine.dispose()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
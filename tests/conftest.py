@@ -0,0 +1,32 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Приложение настраивается при импорте, поэтому временная база и каталог архива
+# задаются до первого импорта app/main.py
+TEST_DIR = tempfile.mkdtemp(prefix="game-data-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'game_data.db')}"
+os.environ["ARCHIVE_DIR"] = os.path.join(TEST_DIR, "archive")
+os.environ["BROADCAST_BACKEND"] = "local"
+os.chdir(ROOT)  # Приложение ищет каталог static относительно текущего каталога
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+
+@pytest.fixture(scope="session")
+def app_main():
+    import main
+    return main
+
+
+@pytest.fixture
+def tmp_dir(tmp_path):
+    return str(tmp_path)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+
+def test_new_database_uses_incremental_vacuum_without_full_vacuum(app_main, tmp_dir):
+    path = os.path.join(tmp_dir, "fresh.db")
+    connection = sqlite3.connect(path)
+    app_main.configure_sqlite_connection(connection)
+    connection.execute("CREATE TABLE t (x)")
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    connection.close()
+
+
+def test_existing_database_is_not_vacuumed_on_connect(app_main, tmp_dir):
+    path = os.path.join(tmp_dir, "existing.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE t (x)")
+    connection.commit()
+    app_main.configure_sqlite_connection(connection)
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    connection.close()
+
+
+def insert(app_main, player_name, *timestamps):
+    app_main.bulk_insert_player_data([app_main.record_from_input(app_main.PlayerDataIn(
+        player_name=player_name, dialog_text=f"запись {timestamp:%Y-%m-%d %H:%M}", data_type="dialog",
+        timestamp=timestamp,
+    )) for timestamp in timestamps])
+
+
+def test_archiving_resumes_after_copy_was_committed(app_main):
+    insert(app_main, "archived", *[datetime(2001, 3, 1) + timedelta(hours=i) for i in range(5)])
+    month_file = os.path.join(app_main.ARCHIVE_DIR, app_main.archive_file_name("2001-03"))
+    os.makedirs(app_main.ARCHIVE_DIR, exist_ok=True)
+    # Сбой после первого шага: копия уже в архиве, а записи ещё в основной базе и не учтены в манифесте
+    connection = app_main.engine.raw_connection()
+    try:
+        connection.execute("ATTACH DATABASE ? AS archive", (month_file,))
+        for statement in app_main.ARCHIVE_SCHEMA:
+            connection.execute(statement)
+        connection.execute("INSERT INTO archive.player_data SELECT id, player_name, dialog_text, data_type, timestamp "
+                           "FROM main.player_data WHERE player_name = 'archived'")
+        connection.commit()
+        connection.execute("DETACH DATABASE archive")
+    finally:
+        connection.close()
+
+    assert app_main.archive_old_rows(datetime(2001, 4, 1)) == 5
+
+    with app_main.get_db() as session:
+        assert session.query(app_main.PlayerData).filter_by(player_name="archived").count() == 0
+        assert session.get(app_main.ArchiveSegment, "2001-03").row_count == 5
+    archive = sqlite3.connect(month_file)
+    assert archive.execute("SELECT COUNT(*) FROM player_data WHERE player_name = 'archived'").fetchone()[0] == 5
+    archive.close()
+
+
+def read_history(client, player_name, limit):
+    timestamps, cursor = [], None
+    while True:
+        page = client.get(f"/api/player/{player_name}", params={"limit": limit, "cursor": cursor}).json()
+        timestamps += [item["timestamp"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return timestamps
+
+
+def test_history_pages_through_hot_rows_and_archive(app_main):
+    archived = [datetime(2002, 1, 1) + timedelta(days=i) for i in range(4)]
+    hot = [datetime(2024, 2, 1) + timedelta(days=i) for i in range(3)]
+    insert(app_main, "pager", *archived)
+    app_main.archive_old_rows(datetime(2002, 2, 1))
+    insert(app_main, "pager", *hot)
+
+    with TestClient(app_main.app) as client:
+        timestamps = read_history(client, "pager", 2)
+    assert timestamps == [timestamp.isoformat() for timestamp in sorted(archived + hot, reverse=True)]
+
+
+def test_late_old_row_in_hot_table_does_not_hide_archive(app_main):
+    archived = [datetime(2003, 1, 1) + timedelta(days=i) for i in range(4)]
+    insert(app_main, "late", *archived)
+    app_main.archive_old_rows(datetime(2003, 2, 1))
+    # Поздно доставленная запись старше архивных остаётся в основной базе до следующей архивации
+    late = [datetime(2024, 3, 1), datetime(2002, 6, 1)]
+    insert(app_main, "late", *late)
+
+    with TestClient(app_main.app) as client:
+        for limit in (1, 2, 10):
+            timestamps = read_history(client, "late", limit)
+            assert timestamps == [timestamp.isoformat() for timestamp in sorted(archived + late, reverse=True)]
+
+
+def test_only_one_archiver_runs_at_a_time(app_main):
+    insert(app_main, "race", *[datetime(2004, 1, 1) + timedelta(days=i) for i in range(5)])
+    os.makedirs(app_main.ARCHIVE_DIR, exist_ok=True)
+    # Другой воркер удерживает блокировку архивации
+    lock = sqlite3.connect(os.path.join(app_main.ARCHIVE_DIR, "archiver.lock"), isolation_level=None)
+    lock.execute("BEGIN EXCLUSIVE")
+    try:
+        assert app_main.archive_old_rows(datetime(2004, 2, 1)) == 0
+    finally:
+        lock.close()
+
+    with ThreadPoolExecutor(2) as pool:
+        moved = list(pool.map(lambda _: app_main.archive_old_rows(datetime(2004, 2, 1)), range(2)))
+    assert 0 in moved and sum(moved) >= 5  # Один из архиваторов не переносит ничего
+
+    with app_main.get_db() as session:
+        segment = session.get(app_main.ArchiveSegment, "2004-01")
+        assert (segment.row_count, segment.min_timestamp, segment.max_timestamp) == \
+            (5, datetime(2004, 1, 1), datetime(2004, 1, 5))
+    with TestClient(app_main.app) as client:
+        assert len(read_history(client, "race", 2)) == 5
+
+
+def test_manifest_timestamps_survive_empty_values(app_main):
+    connection = app_main.engine.raw_connection()
+    try:
+        # Запись манифеста с пустыми границами, оставленная прежней версией архивации
+        connection.execute("INSERT INTO archive_manifest (month, path, row_count) VALUES ('2005-01', ?, 0)",
+                           (app_main.archive_file_name("2005-01"),))
+        connection.commit()
+    finally:
+        connection.close()
+    insert(app_main, "bounds", datetime(2005, 1, 1), datetime(2005, 1, 2))
+    app_main.archive_old_rows(datetime(2005, 2, 1))
+
+    with app_main.get_db() as session:
+        segment = session.get(app_main.ArchiveSegment, "2005-01")
+        assert (segment.min_timestamp, segment.max_timestamp) == (datetime(2005, 1, 1), datetime(2005, 1, 2))
+
+
+def test_history_opens_only_archives_with_player_rows(app_main):
+    insert(app_main, "archived-other", datetime(2006, 1, 1), datetime(2006, 1, 2))
+    app_main.archive_old_rows(datetime(2006, 2, 1))
+    # Архивная база чужого месяца недоступна: попытка открыть её завершилась бы ошибкой
+    os.remove(os.path.join(app_main.ARCHIVE_DIR, app_main.archive_file_name("2006-01")))
+    insert(app_main, "recent", datetime(2024, 4, 1), datetime(2024, 4, 2))
+
+    with TestClient(app_main.app) as client:
+        assert len(read_history(client, "recent", 1)) == 2
+
+
+def test_backfill_lists_players_of_existing_archives(app_main):
+    insert(app_main, "backfilled", datetime(2007, 1, 1))
+    app_main.archive_old_rows(datetime(2007, 2, 1))
+    connection = app_main.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM archive_players WHERE month = '2007-01'")
+        app_main.backfill_archive_players(cursor)
+        connection.commit()
+        assert cursor.execute("SELECT player_name FROM archive_players WHERE month = '2007-01'").fetchall() == \
+            [("backfilled",)]
+    finally:
+        connection.close()
@@ -0,0 +1,209 @@
+import asyncio
+import os
+
+import pytest
+
+
+class FakeRedisPubSub:
+    def __init__(self, server):
+        self.server = server
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.server.subscribers.setdefault(channel, []).append(self)
+        self.queue.put_nowait({"type": "subscribe", "data": 1})
+
+    async def listen(self):
+        while True:
+            item = await self.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def unsubscribe(self, channel):
+        if self in self.server.subscribers.get(channel, []):
+            self.server.subscribers[channel].remove(self)
+
+    async def close(self):
+        pass
+
+
+# Локальная подмена Redis: pub/sub в пределах одного цикла событий
+class FakeRedis:
+    def __init__(self):
+        self.subscribers = {}
+
+    def pubsub(self):
+        return FakeRedisPubSub(self)
+
+    def drop_connections(self):
+        # Разрыв соединений всех подписчиков, как при перезапуске сервера
+        for subscribers in self.subscribers.values():
+            for pubsub in subscribers:
+                pubsub.queue.put_nowait(ConnectionError("Connection closed by server."))
+            subscribers.clear()
+
+    async def publish(self, channel, data):
+        for pubsub in self.subscribers.get(channel, []):
+            pubsub.queue.put_nowait({"type": "message", "data": data})
+        return len(self.subscribers.get(channel, []))
+
+
+async def exchange(first, second, settle, before=None):
+    received = {"first": [], "second": []}
+    await first.start(lambda message, data_type: received["first"].append((message, data_type)))
+    await second.start(lambda message, data_type: received["second"].append((message, data_type)))
+    try:
+        if before is not None:
+            await before()
+        await first.publish("from-first", "dialog")
+        await second.publish("from-second", "chat")
+        await settle()
+    finally:
+        await first.stop()
+        await second.stop()
+    return received
+
+
+def test_sqlite_backend_delivers_across_workers_without_echo(app_main, tmp_dir):
+    path = os.path.join(tmp_dir, "hub.db")
+    first = app_main.SqliteBroadcastBackend(path=path, poll_interval=0.01)
+    second = app_main.SqliteBroadcastBackend(path=path, poll_interval=0.01)
+
+    received = asyncio.run(exchange(first, second, lambda: asyncio.sleep(0.3)))
+
+    # Своё сообщение доставляется локально ровно один раз, чужое приходит через концентратор
+    assert sorted(received["first"]) == [("from-first", "dialog"), ("from-second", "chat")]
+    assert sorted(received["second"]) == [("from-first", "dialog"), ("from-second", "chat")]
+
+
+def test_sqlite_backend_skips_history_from_before_start(app_main, tmp_dir):
+    path = os.path.join(tmp_dir, "hub.db")
+
+    async def scenario():
+        old = app_main.SqliteBroadcastBackend(path=path, poll_interval=0.01)
+        await old.start(lambda message, data_type: None)
+        await old.publish("stale", "dialog")
+        await old.stop()
+        received = []
+        late = app_main.SqliteBroadcastBackend(path=path, poll_interval=0.01)
+        await late.start(lambda message, data_type: received.append(message))
+        await asyncio.sleep(0.1)
+        await late.stop()
+        return received
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_redis_backend_delivers_across_workers_without_echo(app_main):
+    server = FakeRedis()
+    first = app_main.RedisBroadcastBackend(client=server)
+    second = app_main.RedisBroadcastBackend(client=server)
+
+    received = asyncio.run(exchange(first, second, lambda: asyncio.sleep(0.05)))
+
+    assert sorted(received["first"]) == [("from-first", "dialog"), ("from-second", "chat")]
+    assert sorted(received["second"]) == [("from-first", "dialog"), ("from-second", "chat")]
+
+
+def test_unknown_slow_consumer_policy_fails_at_startup(app_main):
+    with pytest.raises(ValueError):
+        app_main.ConnectionManager(policy="typo", backend=app_main.LocalBroadcastBackend())
+
+
+class FakeWebSocket:
+    pass
+
+
+@pytest.mark.parametrize("policy, accepted, queued", [
+    ("drop_oldest", [True] * 5, ["2", "3", "4"]),
+    ("coalesce", [True] * 5, ["3", "4"]),
+    ("disconnect", [True, True, True, False, False], ["0", "1", "2"]),
+])
+def test_slow_consumer_policies(app_main, policy, accepted, queued):
+    async def scenario():
+        subscriber = app_main.Subscriber(FakeWebSocket(), "dialog", 3, policy)
+        results = [subscriber.offer(str(i)) for i in range(5)]
+        return results, [subscriber.queue.get_nowait() for _ in range(subscriber.queue.qsize())]
+
+    assert asyncio.run(scenario()) == (accepted, queued)
+
+
+def test_redis_backend_resubscribes_after_connection_loss(app_main, monkeypatch):
+    monkeypatch.setattr(app_main, "BROADCAST_RECONNECT_DELAY", 0.01)
+    server = FakeRedis()
+    first = app_main.RedisBroadcastBackend(client=server)
+    second = app_main.RedisBroadcastBackend(client=server)
+
+    async def reconnect():
+        server.drop_connections()
+        await asyncio.sleep(0.1)
+
+    received = asyncio.run(exchange(first, second, lambda: asyncio.sleep(0.05), before=reconnect))
+
+    assert sorted(received["first"]) == [("from-first", "dialog"), ("from-second", "chat")]
+    assert sorted(received["second"]) == [("from-first", "dialog"), ("from-second", "chat")]
+
+
+def test_redis_publish_errors_are_logged(app_main, caplog):
+    class BrokenRedis(FakeRedis):
+        async def publish(self, channel, data):
+            raise ConnectionError("Connection refused")
+
+    backend = app_main.RedisBroadcastBackend(client=BrokenRedis())
+
+    async def scenario():
+        await backend.start(lambda message, data_type: None)
+        await backend.publish("lost", "dialog")
+        await asyncio.sleep(0.01)
+        await backend.stop()
+
+    asyncio.run(scenario())
+    assert "Не удалось опубликовать сообщение в Redis" in caplog.text
+
+
+class SlowWebSocket:
+    def __init__(self):
+        self.closed = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await asyncio.Event().wait()  # Получатель не читает сообщения
+
+    async def close(self, code):
+        self.closed.set()
+
+
+def test_dropped_messages_total_survives_disconnect(app_main):
+    async def scenario():
+        manager = app_main.ConnectionManager(max_queue=2, policy="drop_oldest",
+                                             backend=app_main.LocalBroadcastBackend())
+        websocket = SlowWebSocket()
+        await manager.connect(websocket, "dialog")
+        for i in range(6):
+            manager.publish(str(i), "dialog")
+        dropped = manager.stats()["dropped_messages"]
+        manager.disconnect(websocket)
+        return dropped, manager.stats()["dropped_messages"]
+
+    dropped, after = asyncio.run(scenario())
+    assert dropped == after == 4  # Очередь на 2 сообщения из 6
+
+
+def test_evicted_subscriber_is_closed(app_main):
+    async def scenario():
+        manager = app_main.ConnectionManager(max_queue=1, policy="disconnect",
+                                             backend=app_main.LocalBroadcastBackend())
+        websocket = SlowWebSocket()
+        await manager.connect(websocket, "dialog")
+        await asyncio.sleep(0)
+        for i in range(3):
+            manager.publish(str(i), "dialog")
+        assert len(manager._closing) == 1
+        await asyncio.wait_for(websocket.closed.wait(), 1)
+        await asyncio.sleep(0)
+        return manager.disconnected_slow, len(manager._closing)
+
+    assert asyncio.run(scenario()) == (1, 0)
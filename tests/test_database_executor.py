@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+def test_query_timeout_returns_503_with_retry_after(app_main, monkeypatch):
+    def slow_page(*args):
+        time.sleep(0.3)
+        return []
+
+    with TestClient(app_main.app) as client:
+        monkeypatch.setattr(app_main.db, "timeout", 0.05)
+        monkeypatch.setattr(app_main, "fetch_player_page", slow_page)
+        response = client.get("/api/player/slow")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_pool_runs_at_most_max_workers_queries(app_main):
+    executor = app_main.DatabaseExecutor(max_workers=2, timeout=5)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def query():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    async def scenario():
+        await asyncio.gather(*(executor.run(query) for _ in range(6)))
+
+    executor.start()
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert max(peak) == 2
+
+
+def test_executor_runs_only_between_start_and_shutdown(app_main):
+    executor = app_main.DatabaseExecutor(max_workers=1, timeout=5)
+    with pytest.raises(RuntimeError):
+        asyncio.run(executor.run(lambda: 1))
+    for _ in range(2):  # Жизненный цикл приложения может запускаться повторно
+        executor.start()
+        assert asyncio.run(executor.run(lambda: 1)) == 1
+        executor.shutdown()
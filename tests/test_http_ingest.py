@@ -0,0 +1,49 @@
+import json
+import queue
+import time
+
+from fastapi.testclient import TestClient
+
+
+def test_single_record_returns_503_when_ingest_queue_is_full(app_main, monkeypatch):
+    async def full(record):
+        raise queue.Full
+
+    with TestClient(app_main.app) as client:
+        monkeypatch.setattr(app_main.ingest_queue, "put", full)
+        response = client.post("/player_data", json={"player_name": "p", "dialog_text": "x", "data_type": "dialog"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_batch_reports_accepted_and_rejected_lines(app_main):
+    lines = [
+        json.dumps({"player_name": "batch", "dialog_text": "one", "data_type": "dialog"}),
+        "not json",
+        json.dumps({"player_name": "batch"}),
+        json.dumps({"player_name": "batch", "dialog_text": "two", "data_type": "chat",
+                    "timestamp": "2024-01-01T12:00:00+03:00"}),
+    ]
+    with TestClient(app_main.app) as client:
+        result = client.post("/player_data/batch", content="\n".join(lines)).json()
+        items = client.get("/api/player/batch").json()["items"]
+    assert (result["accepted"], result["rejected"]) == (2, 2)
+    assert [error["line"] for error in result["errors"]] == [2, 3]
+    assert items[-1]["timestamp"] == "2024-01-01T09:00:00"  # Время с часовым поясом сохраняется в UTC
+
+
+def test_batch_counts_slow_insert_as_accepted(app_main, monkeypatch):
+    stored = []
+
+    def slow_insert(records):
+        time.sleep(0.2)  # Дольше таймаута запросов к базе
+        stored.extend(records)
+        return []
+
+    monkeypatch.setattr(app_main.db, "timeout", 0.05)
+    monkeypatch.setattr(app_main, "bulk_insert_player_data", slow_insert)
+    line = json.dumps({"player_name": "slow", "dialog_text": "x", "data_type": "dialog"})
+    with TestClient(app_main.app) as client:
+        result = client.post("/player_data/batch", content="\n".join([line] * 3)).json()
+    assert (result["accepted"], result["rejected"]) == (3, 0)
+    assert len(stored) == 3
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from starlette.websockets import WebSocketDisconnect
+
+
+@pytest.fixture
+def flushed(app_main, monkeypatch):
+    # Пакеты, переданные потоком записи в базу
+    batches = []
+    done = threading.Event()
+
+    def record_batch(records):
+        batches.append(list(records))
+        done.set()
+        return []
+
+    monkeypatch.setattr(app_main, "bulk_insert_player_data", record_batch)
+    return batches, done
+
+
+def records(count):
+    return [{"player_name": "queue", "dialog_text": str(i), "data_type": "dialog", "timestamp": None}
+            for i in range(count)]
+
+
+async def put_all(ingest_queue, items):
+    for item in items:
+        await ingest_queue.put(item)
+
+
+def test_flushes_when_batch_is_full(app_main, flushed):
+    batches, done = flushed
+    ingest_queue = app_main.IngestQueue(batch_size=3, flush_interval=30.0, max_size=100)
+    ingest_queue.start()
+    try:
+        asyncio.run(put_all(ingest_queue, records(3)))
+        assert done.wait(2.0)
+        assert [len(batch) for batch in batches] == [3]
+    finally:
+        ingest_queue.stop()
+
+
+def test_flushes_after_interval(app_main, flushed):
+    batches, done = flushed
+    ingest_queue = app_main.IngestQueue(batch_size=100, flush_interval=0.1, max_size=100)
+    ingest_queue.start()
+    try:
+        started = time.monotonic()
+        asyncio.run(put_all(ingest_queue, records(2)))
+        assert done.wait(2.0)
+        assert time.monotonic() - started >= 0.1
+        assert [len(batch) for batch in batches] == [2]
+    finally:
+        ingest_queue.stop()
+
+
+def test_flushes_remaining_records_on_stop(app_main, flushed):
+    batches, _ = flushed
+    ingest_queue = app_main.IngestQueue(batch_size=100, flush_interval=30.0, max_size=100)
+    ingest_queue.start()
+    asyncio.run(put_all(ingest_queue, records(5)))
+    started = time.monotonic()
+    ingest_queue.stop()
+    # Остановка не ждёт flush_interval и дописывает всё, что осталось в очереди
+    assert time.monotonic() - started < 5.0
+    assert sum(len(batch) for batch in batches) == 5
+    assert ingest_queue.stats()["flushed_rows"] == 5
+
+
+def test_put_raises_when_queue_stays_full(app_main):
+    ingest_queue = app_main.IngestQueue(batch_size=10, flush_interval=0.1, max_size=1, put_timeout=0.05)
+    asyncio.run(ingest_queue.put(records(1)[0]))  # Поток записи не запущен, очередь не освобождается
+    with pytest.raises(queue.Full):
+        asyncio.run(ingest_queue.put(records(1)[0]))
+
+
+def test_websocket_closes_with_1013_when_queue_is_full(app_main, monkeypatch):
+    async def full(record):
+        raise queue.Full
+
+    with TestClient(app_main.app) as client:
+        monkeypatch.setattr(app_main.ingest_queue, "put", full)
+        with client.websocket_connect("/ws?data_type=dialog") as websocket:
+            websocket.send_text(json.dumps({"player_name": "p", "dialog_text": "x", "data_type": "dialog"}))
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_text()
+    assert closed.value.code == 1013
+
+
+def test_websocket_rejects_bad_frames_and_keeps_connection(app_main, flushed):
+    with TestClient(app_main.app) as client:
+        with client.websocket_connect("/ws?data_type=dialog") as websocket:
+            for frame in ("not json", json.dumps({"player_name": "p", "data_type": "dialog"}), "[1, 2]"):
+                websocket.send_text(frame)
+                assert "error" in json.loads(websocket.receive_text())
+            good = json.dumps({"player_name": "p", "dialog_text": "x", "data_type": "dialog"})
+            websocket.send_text(good)
+            assert websocket.receive_text() == good  # Рассылка корректного сообщения продолжает работать
+
+
+def test_flush_retries_when_database_is_locked(app_main, monkeypatch):
+    attempts = []
+
+    def locked_then_ok(batch):
+        attempts.append(len(batch))
+        if len(attempts) < 3:
+            raise OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+        return []
+
+    monkeypatch.setattr(app_main, "bulk_insert_player_data", locked_then_ok)
+    monkeypatch.setattr(app_main, "INGEST_RETRY_BACKOFF", 0.01)
+    ingest_queue = app_main.IngestQueue(batch_size=2, flush_interval=0.05)
+    ingest_queue._flush(records(2))
+    assert attempts == [2, 2, 2]
+    assert (ingest_queue.flushed_rows, ingest_queue.failed_rows) == (2, 0)
+
+
+def test_flush_gives_up_after_retries(app_main, monkeypatch):
+    def locked(batch):
+        raise OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+
+    monkeypatch.setattr(app_main, "bulk_insert_player_data", locked)
+    monkeypatch.setattr(app_main, "INGEST_RETRY_BACKOFF", 0.001)
+    ingest_queue = app_main.IngestQueue(batch_size=2, flush_interval=0.05)
+    ingest_queue._flush(records(2))
+    assert (ingest_queue.flushed_rows, ingest_queue.failed_rows) == (0, 2)
@@ -0,0 +1,27 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+
+def test_unhandled_exceptions_are_recorded_as_500(app_main):
+    app = FastAPI()
+    app.add_middleware(app_main.MetricsMiddleware)
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    @app.get("/broken-stream")
+    async def broken_stream():
+        async def body():
+            yield "начало"
+            raise RuntimeError("boom")
+        return StreamingResponse(body())
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        assert client.get("/boom").status_code == 500
+        client.get("/broken-stream")
+
+    rendered = app_main.metrics.render()
+    assert 'http_request_duration_seconds_count{method="GET",route="/boom",status="500"} 1' in rendered
+    assert 'http_request_duration_seconds_count{method="GET",route="/broken-stream",status="500"} 1' in rendered
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+
+from sqlalchemy import create_engine, event
+
+# Схема player_data в том виде, в каком её создавали версии приложения до миграций
+OLD_SCHEMA = [
+    "CREATE TABLE player_data (id INTEGER NOT NULL, player_name VARCHAR(50), dialog_text TEXT, "
+    "data_type VARCHAR(50), timestamp DATETIME, PRIMARY KEY (id))",
+    "CREATE INDEX ix_player_data_id ON player_data (id)",
+    "CREATE INDEX ix_player_data_player_name ON player_data (player_name)",
+]
+
+HISTORY_QUERY = (
+    "SELECT id, timestamp, dialog_text, data_type FROM player_data WHERE player_name = 'p1' "
+    "AND data_type = 'dialog' AND (timestamp < '2024-02-01' OR (timestamp = '2024-02-01' AND id < 100)) "
+    "ORDER BY timestamp DESC, id DESC LIMIT 201"
+)
+
+
+def test_old_database_is_upgraded_in_place(app_main, tmp_dir):
+    path = os.path.join(tmp_dir, "old.db")
+    connection = sqlite3.connect(path)
+    for statement in OLD_SCHEMA:
+        connection.execute(statement)
+    connection.executemany(
+        "INSERT INTO player_data (player_name, dialog_text, data_type, timestamp) VALUES (?, ?, ?, ?)",
+        [(f"p{i % 3}", f"текст {i}", "dialog" if i % 2 else "chat", f"2024-01-{i % 28 + 1:02d} 10:00:00.000000")
+         for i in range(60)],
+    )
+    connection.commit()
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == 0
+    connection.close()
+
+    # Те же шаги, что выполняет приложение при импорте
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", app_main.configure_sqlite_connection)
+    app_main.Base.metadata.create_all(bind=engine)
+    app_main.run_migrations(bind=engine)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        assert cursor.execute("PRAGMA user_version").fetchone()[0] == len(app_main.MIGRATIONS)
+        indexes = {row[1] for row in cursor.execute("PRAGMA index_list(player_data)")}
+        assert {"ix_player_data_player_ts", "ix_player_data_player_type_ts", "ix_player_data_ts"} <= indexes
+        assert not indexes & {"ix_player_data_id", "ix_player_data_player_name"}
+        plan = " ".join(row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + HISTORY_QUERY))
+        assert "ix_player_data_player_type_ts" in plan
+        assert "TEMP B-TREE" not in plan
+        assert cursor.execute("SELECT COUNT(*), SUM(total) FROM players").fetchone() == (3, 60)
+        assert cursor.execute(
+            "SELECT COUNT(*) FROM player_data_fts WHERE player_data_fts MATCH 'текст'").fetchone()[0] == 60
+
+        assert cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert cursor.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert cursor.execute("PRAGMA busy_timeout").fetchone()[0] == app_main.SQLITE_BUSY_TIMEOUT_MS
+        assert cursor.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+        cursor.close()
+    finally:
+        connection.close()
+        engine.dispose()
@@ -0,0 +1,52 @@
+from fastapi.testclient import TestClient
+
+
+def test_load_racing_with_invalidate_is_not_stored(app_main, monkeypatch):
+    cache = app_main.PlayerDirectoryCache(ttl=60)
+    loads = []
+
+    def load():
+        # Инвалидация приходит, пока загрузка ещё читает базу
+        if not loads:
+            cache.invalidate()
+        loads.append(len(loads))
+        return {"players": [], "version": len(loads)}
+
+    monkeypatch.setattr(cache, "_load", load)
+
+    assert cache.get()["version"] == 1
+    assert cache.peek() is None
+    assert cache.get()["version"] == 2
+    assert cache.peek()["version"] == 2
+
+
+def insert(app_main, player_name):
+    app_main.bulk_insert_player_data([app_main.record_from_input(app_main.PlayerDataIn(
+        player_name=player_name, dialog_text="x", data_type="dialog"))])
+
+
+def test_index_etag_changes_only_with_new_players(app_main):
+    insert(app_main, "etag-existing")
+    with TestClient(app_main.app) as client:
+        index = client.get("/")
+        players = client.get("/api/players")
+        assert index.status_code == players.status_code == 200
+
+        # Новая запись существующего игрока меняет JSON, но не главную страницу
+        insert(app_main, "etag-existing")
+        assert client.get("/", headers={"If-None-Match": index.headers["etag"]}).status_code == 304
+        assert client.get("/api/players", headers={"If-None-Match": players.headers["etag"]}).status_code == 200
+
+        insert(app_main, "etag-new")
+        response = client.get("/", headers={"If-None-Match": index.headers["etag"]})
+        assert response.status_code == 200
+        assert "etag-new" in response.text
+
+
+def test_write_for_existing_player_keeps_index_entry(app_main):
+    cache = app_main.PlayerDirectoryCache(ttl=60)
+    index = cache.get("index")
+    cache.get("directory")
+    cache.invalidate(players_added=False)
+    assert cache.peek("index") is index
+    assert cache.peek("directory") is None
@@ -0,0 +1,33 @@
+import html
+import re
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+TIMESTAMPS = [datetime(2024, 6, 1, 9), datetime(2024, 6, 1, 10), datetime(2024, 6, 2, 9), datetime(2024, 6, 3, 9)]
+
+
+def test_player_page_streams_day_sections_and_next_page_link(app_main):
+    app_main.bulk_insert_player_data([app_main.record_from_input(app_main.PlayerDataIn(
+        player_name="page player", dialog_text=f"запись <{i}>", data_type="dialog", timestamp=timestamp,
+    )) for i, timestamp in enumerate(TIMESTAMPS)])
+    days = [app_main.format_moscow_time(timestamp)[0] for timestamp in TIMESTAMPS]
+
+    with TestClient(app_main.app) as client:
+        first = client.get("/player/page player", params={"limit": 3})
+        assert first.status_code == 200
+        assert re.findall(r'<h2 class="date-header">(.*?)</h2>', first.text) == [days[3], days[2], days[1]]
+        assert "запись &lt;3&gt;" in first.text  # Текст записей экранируется
+        link = re.search(r'<a class="back-button" href="([^"]+)">Более ранние записи</a>', first.text)
+        assert link is not None
+
+        second = client.get(html.unescape(link.group(1)))
+        assert re.findall(r'<h2 class="date-header">(.*?)</h2>', second.text) == [days[0]]
+        assert "запись &lt;0&gt;" in second.text and "запись &lt;1&gt;" not in second.text
+        assert "Более ранние записи" not in second.text
+
+
+def test_player_page_rejects_bad_cursor(app_main):
+    with TestClient(app_main.app) as client:
+        assert client.get("/player/anyone", params={"cursor": "not-a-cursor"}).status_code == 400
+        assert client.get("/api/player/anyone", params={"cursor": "not-a-cursor"}).status_code == 400
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+
+def record(app_main, text, minutes):
+    return app_main.record_from_input(app_main.PlayerDataIn(
+        player_name="searcher", dialog_text=text, data_type="dialog",
+        timestamp=datetime(2024, 5, 1) + timedelta(minutes=minutes),
+    ))
+
+
+def test_search_cursor_is_stable_when_rows_are_inserted(app_main):
+    app_main.bulk_insert_player_data([record(app_main, f"дракон запись {i}", i) for i in range(10)])
+    seen = []
+    with TestClient(app_main.app) as client:
+        page = client.get("/api/search", params={"q": "дракон", "limit": 4}).json()
+        seen += [item["id"] for item in page["items"]]
+        assert [item["rank"] for item in page["items"]] == sorted(item["rank"] for item in page["items"])
+        # Более релевантные записи, добавленные между страницами, не сдвигают курсор
+        app_main.bulk_insert_player_data([record(app_main, "дракон дракон дракон", 100),
+                                          record(app_main, "дракон дракон", -100)])
+        while page["next_cursor"]:
+            page = client.get("/api/search", params={"q": "дракон", "limit": 4, "cursor": page["next_cursor"]}).json()
+            seen += [item["id"] for item in page["items"]]
+    assert len(seen) == len(set(seen)) == 10  # Добавленные записи новее курсора и в следующие страницы не попадают
+    assert min(seen[:4]) > max(seen[4:])  # Страницы идут от новых записей к старым